@@ -0,0 +1,41 @@
+"""
+Check that all parser engines of Info give the same result on recorded index pages and show their speed.
+
+Usage: python benchmarks/equivalence.py [PAGE...]   (by default all benchmarks/fixtures/index*.htm)
+"""
+import os
+import sys
+import glob
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rvcm.router import Info
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def main(paths):
+    failed = False
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            page = f.read()
+        results = {}
+        for engine in Info.ENGINES:
+            info = Info()
+            info.parse(page, engine=engine)
+            results[engine] = info.to_dict()
+            number = 200
+            spent = timeit.timeit(lambda: Info().parse(page, engine=engine), number=number) / number
+            print("{:40s} {:6s} {:8.1f} us".format(os.path.basename(path), engine, spent * 1e6))
+        reference = results[Info.ENGINES[-1]]
+        for engine, result in results.items():
+            if result != reference:
+                failed = True
+                diff = {k: (v, reference[k]) for k, v in result.items() if v != reference[k]}
+                print("MISMATCH {} {}: {}".format(os.path.basename(path), engine, diff))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURES, 'index*.htm')))))
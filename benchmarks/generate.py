@@ -0,0 +1,68 @@
+"""
+Synthetic router pages at scale: virtual server page with thousands of NAT rules and call log page with
+hundred thousands of records. Pages are built from the recorded fixtures, only the data line is replaced,
+so they are parsed exactly like real ones. Output is deterministic for the same arguments.
+
+Usage:
+    python benchmarks/generate.py nat|calls COUNT [--seed 1] > page.htm
+    python benchmarks/generate.py index > page.htm
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rvcm.emulator import vs_list, call_records
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _replace_line(page, prefix, line):
+    return '\n'.join(line if row.startswith(prefix) else row for row in page.split('\n'))
+
+
+def nat_page(count, seed=1):
+    return _replace_line(fixture('vs.htm'), 'var vs_list', 'var vs_list = "{}";'.format(vs_list(count, seed)))
+
+
+def calls_page(count, seed=1):
+    data = ', '.join('"' + record + '"' for record in call_records(count, seed))
+    return _replace_line(fixture('voice_call_logs.htm'), 'var call_logs', 'var call_logs = [' + data + '];')
+
+
+def index_page():
+    # status page has no records to scale: the recorded one is used as is
+    return fixture('index.htm')
+
+
+GENERATORS = {
+    'nat': nat_page,
+    'calls': calls_page,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('kind', choices=sorted(GENERATORS) + ['index'])
+    parser.add_argument('count', type=int, nargs='?')
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+    if options.kind == 'index':
+        if options.count is not None:
+            parser.error("index page has no COUNT")
+        sys.stdout.write(index_page())
+        return 0
+    if options.count is None:
+        parser.error("COUNT is required for " + options.kind)
+    sys.stdout.write(GENERATORS[options.kind](options.count, options.seed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Startup benchmark of rvcm CLI: for each command measures wall time of the whole process, time spent in
+rvcm after interpreter start and which heavy dependencies were imported. Exits with code 1 if a command
+imports a dependency it must not need or is slower than --max-ms.
+
+Usage: python benchmarks/startup.py [--runs 5] [--max-ms 0]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# command -> dependencies that must not be imported by it
+COMMANDS = [
+    (['--help'], ['requests', 'lxml', 'rvcm.router', 'rvcm.nat', 'rvcm.calls']),
+    (['router', '--help'], ['requests', 'lxml']),
+    (['router', 'info', '--help'], ['requests', 'lxml']),
+    (['nat', '--help'], ['requests', 'lxml', 'rvcm.router']),
+    (['nat', 'info', '--help'], ['requests', 'lxml', 'rvcm.router']),
+    (['calls', '--help'], ['requests', 'lxml', 'rvcm.router']),
+    (['serve', '--help'], ['requests', 'lxml']),
+]
+HEAVY = ['click', 'requests', 'urllib3', 'lxml', 'rvcm.router', 'rvcm.nat', 'rvcm.calls', 'rvcm.serve', 'aiohttp']
+
+CHILD = '''
+import sys, time, json, runpy, io, contextlib
+started = time.perf_counter()
+sys.argv = ['rvcm'] + json.loads(sys.argv[1])
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        runpy.run_module('rvcm', run_name='__main__')
+    except SystemExit:
+        pass
+spent = time.perf_counter() - started
+sys.stderr.write(json.dumps({"spent": spent, "modules": [m for m in sys.modules]}))
+'''
+
+
+def measure(args, runs):
+    walls, spent, modules = [], [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', CHILD, json.dumps(args)], cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        walls.append(time.perf_counter() - started)
+        report = json.loads(proc.stderr.decode().strip().splitlines()[-1])
+        spent.append(report['spent'])
+        modules = report['modules']
+    return sorted(walls)[runs // 2], sorted(spent)[runs // 2], modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='runs of each command (median is reported)')
+    parser.add_argument('--max-ms', type=float, default=0, help='fail if rvcm time of a command is higher')
+    options = parser.parse_args()
+    failed = False
+    print("{:24s} {:>9s} {:>9s}  {}".format("COMMAND", "WALL-MS", "RVCM-MS", "HEAVY IMPORTS"))
+    for args, forbidden in COMMANDS:
+        wall, spent, modules = measure(args, options.runs)
+        heavy = [name for name in HEAVY if name in modules]
+        print("{:24s} {:9.1f} {:9.1f}  {}".format(" ".join(args), wall * 1000, spent * 1000, " ".join(heavy)))
+        bad = [name for name in forbidden if name in modules]
+        if bad:
+            failed = True
+            print("  REGRESSION: imports " + ", ".join(bad))
+        if options.max_ms and spent * 1000 > options.max_ms:
+            failed = True
+            print("  REGRESSION: slower than {} ms".format(options.max_ms))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Benchmark suite of rvcm hot paths: parsing of router pages, serialisation (form fields and exports) and
+full CLI round trip against a local HTTP server, on recorded fixtures and synthetic pages at scale
+(see benchmarks/generate.py). Cases are timed in several rounds (`--rounds`) interleaved with each other, so
+a slow period of the machine affects only some samples; for every case minimum and median time, noise
+(interquartile range relative to median) and peak memory (tracemalloc) are reported.
+
+Usage:
+    python benchmarks/suite.py [--scale 1.0] [--runs 5] [--rounds 3] [--filter TEXT] [--save benchmarks/baseline.json]
+    python benchmarks/suite.py compare [--baseline benchmarks/baseline.json] [--time 0.25] [--memory 0.10]
+
+`compare` runs the suite and exits with code 1 if any case uses more memory than in the baseline by more than
+given fraction, or if its minimum time is slower than baseline minimum by more than given fraction plus
+measured noise (the larger of baseline and current one).
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+import socketserver
+import tracemalloc
+import http.server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import generate
+from rvcm.cli import cli
+from rvcm.nat import NAT
+from rvcm.calls import History
+from rvcm.router import Info
+from rvcm.formats import write_records, msgpack
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+NAT_RULES = 5000
+CALLS = 100000
+
+
+class Pages(http.server.BaseHTTPRequestHandler):
+    """
+    Serves router pages by path (without query), without authorization
+    """
+    pages = {}
+
+    def do_GET(self):
+        page = self.pages.get(self.path.split('?')[0])
+        if page is None:
+            self.send_error(404)
+            return
+        data = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+@contextlib.contextmanager
+def serve(pages):
+    handler = type('Handler', (Pages,), {'pages': pages})
+    server = Server(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield '127.0.0.1:{}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_cli(address, *args):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        cli.main(['--ip', address, '--password', 'x'] + list(args), prog_name='rvcm', standalone_mode=False)
+    return out.getvalue()
+
+
+def parsed(cls, page):
+    obj = cls()
+    obj.parse(page)
+    return obj
+
+
+def cases(scale, address):
+    """
+    Benchmark cases
+
+    :param scale: multiplier of synthetic sizes
+    :param address: address of local server with fixture pages
+    :return: list of (name, function) tuples
+    """
+    rules = max(1, int(NAT_RULES * scale))
+    calls = max(1, int(CALLS * scale))
+    index = generate.fixture('index.htm')
+    vs = generate.fixture('vs.htm')
+    logs = generate.fixture('voice_call_logs.htm')
+    big_vs = generate.nat_page(rules)
+    big_logs = generate.calls_page(calls)
+    big_nat = parsed(NAT, big_vs)
+    big_history = parsed(History, big_logs)
+    info = parsed(Info, index)
+    return [
+        ('parse.info.fast', lambda: Info().parse(index, engine='fast')),
+        ('parse.info.tree', lambda: Info().parse(index, engine='tree')),
+        ('parse.nat', lambda: NAT().parse(vs)),
+        ('parse.nat.{}'.format(rules), lambda: NAT().parse(big_vs)),
+        ('parse.calls', lambda: History().parse(logs)),
+        ('parse.calls.{}'.format(calls), lambda: History().parse(big_logs)),
+        ('serialise.info', lambda: json.dumps(info.to_dict())),
+        ('serialise.nat.form.{}'.format(rules), lambda: list(big_nat.generate_form_fields())),
+        ('serialise.nat.json.{}'.format(rules), lambda: json.dumps([f.to_dict() for f in big_nat.forwards])),
+        ('serialise.calls.json.{}'.format(calls), lambda: json.dumps([c.to_dict() for c in big_history.calls])),
+        ('serialise.calls.csv.{}'.format(calls), lambda: write_records(big_history.calls, 'csv', io.StringIO())),
+    ] + ([
+        ('serialise.calls.msgpack.{}'.format(calls),
+         lambda: write_records(big_history.calls, 'msgpack', io.BytesIO())),
+    ] if msgpack is not None else []) + [
+        ('cli.router.export', lambda: run_cli(address, 'router', 'export')),
+        ('cli.nat.info', lambda: run_cli(address, 'nat', 'info')),
+        ('cli.calls.export', lambda: run_cli(address, 'calls', 'export')),
+        ('cli.calls.export.{}'.format(calls), lambda: run_cli(address + '/big', 'calls', 'export')),
+    ]
+
+
+def timed(func, runs, budget):
+    """
+    Time runs of function
+
+    :param func: function to measure
+    :param runs: number of timed runs (at least one)
+    :param budget: seconds after which no more runs are started
+    :return: list of seconds
+    """
+    spent = []
+    deadline = time.perf_counter() + budget
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        spent.append(time.perf_counter() - started)
+        if time.perf_counter() > deadline:
+            break
+    return spent
+
+
+def peak_kb(func):
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+
+def summary(spent, peak):
+    """
+    :param spent: seconds of all timed runs
+    :param peak: peak memory in KB
+    :return: dict with seconds (median), min_seconds, noise (interquartile range / median) and peak_kb
+    """
+    spent = sorted(spent)
+    median = spent[len(spent) // 2]
+    spread = spent[len(spent) * 3 // 4] - spent[len(spent) // 4]
+    return {'seconds': median, 'min_seconds': spent[0], 'noise': round(spread / median, 4) if median else 0.0,
+            'peak_kb': peak}
+
+
+def run(options):
+    results = {}
+    samples = {}
+    big = generate.calls_page(max(1, int(CALLS * options.scale)))
+    pages = {
+        '/index.htm': generate.fixture('index.htm'),
+        '/vs.htm': generate.fixture('vs.htm'),
+        '/voice_call_logs.htm': generate.fixture('voice_call_logs.htm'),
+        '/big/voice_call_logs.htm': big,
+    }
+    rounds = max(1, options.rounds)
+    with serve(pages) as address:
+        selected = [(name, func) for name, func in cases(options.scale, address)
+                    if not options.filter or options.filter in name]
+        peaks = {}
+        for name, func in selected:
+            func()  # warm up: imports, compiled patterns, connection pool
+            peaks[name] = peak_kb(func)
+        for _ in range(rounds):
+            for name, func in selected:
+                samples.setdefault(name, []).extend(timed(func, options.runs, 10.0 / rounds))
+    print("{:36s} {:>10s} {:>10s} {:>7s} {:>10s}".format("CASE", "MIN-MS", "MEDIAN-MS", "NOISE", "PEAK-KB"))
+    for name, _ in selected:
+        result = results[name] = summary(samples[name], peaks[name])
+        print("{:36s} {:10.3f} {:10.3f} {:6.1f}% {:10d}".format(
+            name, result['min_seconds'] * 1000, result['seconds'] * 1000, result['noise'] * 100, result['peak_kb']))
+    return results
+
+
+def compare(results, baseline, time_limit, memory_limit):
+    """
+    Compare results with baseline
+
+    :return: list of regression descriptions
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        # baselines of older format have median only
+        base_min = base.get('min_seconds', base['seconds'])
+        noise = max(base.get('noise', 0.0), result['noise'])
+        if result['min_seconds'] > base_min * (1 + time_limit + noise):
+            regressions.append("{}: min time {:.3f} ms -> {:.3f} ms (allowed {:.0f}% + noise {:.0f}%)".format(
+                name, base_min * 1000, result['min_seconds'] * 1000, time_limit * 100, noise * 100))
+        if result['peak_kb'] > base['peak_kb'] * (1 + memory_limit) + 16:
+            regressions.append("{}: memory {} KB -> {} KB".format(name, base['peak_kb'], result['peak_kb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', nargs='?', choices=['run', 'compare'], default='run')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of synthetic fixture sizes')
+    parser.add_argument('--runs', type=int, default=5, help='timed runs of each case in every round')
+    parser.add_argument('--rounds', type=int, default=3, help='rounds of timed runs over all cases')
+    parser.add_argument('--filter', default='', help='run only cases containing text')
+    parser.add_argument('--save', metavar='FILE', help='save results as baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline to compare with')
+    parser.add_argument('--time', type=float, default=0.25, help='allowed slowdown of min time (fraction, '
+                                                                  'measured noise is added)')
+    parser.add_argument('--memory', type=float, default=0.10, help='allowed memory growth (fraction)')
+    options = parser.parse_args()
+    results = run(options)
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'scale': options.scale, 'results': results}, f, indent=4, sort_keys=True)
+            f.write('\n')
+    if options.command != 'compare':
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('scale', 1.0) != options.scale:
+        print("baseline was recorded with --scale {}".format(baseline.get('scale', 1.0)))
+        return 2
+    regressions = compare(results, baseline['results'], options.time, options.memory)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
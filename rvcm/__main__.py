@@ -20,10 +20,7 @@ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER I
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-# Import for Click support
-from rvcm import router
-from rvcm import calls
-from rvcm import nat
+# Command groups are loaded on demand (see Cli.LAZY_COMMANDS)
 from rvcm.cli import *
 
 
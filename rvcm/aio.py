@@ -0,0 +1,131 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import asyncio
+from rvcm.auth import DigestAuth
+from rvcm.cli import RouterTimeout, RouterUnavailable, check_status
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class Page:
+    """
+    Downloaded router page (the part of requests.Response used by parsers)
+    """
+
+    def __init__(self, url: str, status_code: int, text: str):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(url=" + repr(self.url) + ", status_code=" + repr(self.status_code) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+class AsyncContext:
+    """
+    Asynchronous connection to single router over aiohttp (install `rvcm[async]`).
+    Requests to the router are limited by `limit` concurrent calls, so many routers can be polled
+    from one event loop without overloading each of them.
+
+    Usage:
+
+        async with AsyncContext(ip, user, password) as ctx:
+            info = await Info().retrieve_async(ctx.getter)
+    """
+
+    def __init__(self, ip, user, password, limit=4, timeout=None, session=None):
+        """
+        :param limit: maximum number of requests to the router at the same time
+        :param timeout: total timeout of each request in seconds
+        :param session: shared aiohttp.ClientSession (not closed by context)
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for async API: pip install rvcm[async]")
+        self.auth = DigestAuth(user, password)
+        self.url = "http://" + ip
+        self.ip = ip
+        self.timeout = timeout
+        self.limit = asyncio.Semaphore(limit)
+        self._own_session = session is None
+        self.session = session
+
+    async def request(self, method: str, url: str, data=None, headers=None) -> Page:
+        """
+        Make request with Digest authentication. Authorization is sent up front when challenge is known,
+        new challenge is requested only when router rejects it
+        :return: downloaded page
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        full_url = self.url + url
+        headers = dict(headers or {})
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with self.limit:
+            for _ in range(2):
+                auth = self.auth.header(method, full_url)
+                if auth:
+                    headers['Authorization'] = auth
+                try:
+                    async with self.session.request(method, full_url, data=data, headers=headers,
+                                                    timeout=timeout) as resp:
+                        text = await resp.text(errors='replace')
+                except asyncio.TimeoutError as ex:
+                    raise RouterTimeout(self.ip, url, "timed out") from ex
+                except aiohttp.ClientConnectionError as ex:
+                    raise RouterUnavailable(self.ip, url, "connection failed ({})".format(
+                        ex.__class__.__name__)) from ex
+                if resp.status == 401 and self.auth.challenge(resp.headers.get('WWW-Authenticate', '')):
+                    continue
+                return Page(full_url, resp.status, text)
+        return Page(full_url, 401, text)
+
+    async def getter(self, url, fresh=False):
+        # pages are never cached here, so every page is fresh
+        resp = await self.request('GET', url)
+        check_status(self.ip, url, resp.status_code, resp.text)
+        return resp
+
+    async def poster(self, url, data, referer=""):
+        resp = await self.request('POST', url, data=data, headers={
+            'Referer': self.url + referer
+        })
+        check_status(self.ip, url, resp.status_code, resp.text)
+        return resp
+
+    async def close(self):
+        """
+        Close own HTTP session
+        """
+        if self._own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
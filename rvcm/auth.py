@@ -0,0 +1,89 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import re
+import threading
+from requests.auth import HTTPDigestAuth
+from requests.utils import parse_dict_header
+
+
+class DigestAuth(HTTPDigestAuth):
+    """
+    Digest authentication that keeps the last router challenge for all threads of one session.
+
+    Once the router sent a challenge, every request carries `Authorization` up front with an incrementing
+    nonce count, so no extra 401 round trip is paid. A new challenge is taken only when the router rejects
+    the nonce (for example because it became stale).
+    """
+
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._lock = threading.Lock()
+        self._chal = {}
+        self._nonce_count = 0
+
+    def init_per_thread_state(self):
+        super().init_per_thread_state()
+        local = self._thread_local
+        with self._lock:
+            if self._chal and not local.last_nonce:
+                # adopt challenge received by another thread
+                local.chal = self._chal
+                local.adopted = self._chal
+                local.last_nonce = self._chal.get('nonce', '')
+
+    def build_digest_header(self, method, url):
+        local = self._thread_local
+        with self._lock:
+            if local.chal is not getattr(local, 'adopted', None):
+                # fresh challenge from the router (first one or nonce rejected)
+                self._chal = local.chal
+                self._nonce_count = 0
+            else:
+                local.chal = self._chal
+            local.adopted = self._chal
+            local.last_nonce = self._chal.get('nonce', '')
+            local.nonce_count = self._nonce_count
+            header = super().build_digest_header(method, url)
+            self._nonce_count = local.nonce_count
+            return header
+
+    def header(self, method: str, url: str):
+        """
+        Make Authorization header for request without requests machinery (used by async client)
+        :param method: HTTP method
+        :param url: full URL of request
+        :return: header value or None if router did not send a challenge yet
+        """
+        self.init_per_thread_state()
+        if not self._thread_local.chal:
+            return None
+        return self.build_digest_header(method, url)
+
+    def challenge(self, www_authenticate: str) -> bool:
+        """
+        Remember new challenge from WWW-Authenticate header of 401 response
+        :return: True if header contains Digest challenge
+        """
+        if 'digest' not in www_authenticate.lower():
+            return False
+        self.init_per_thread_state()
+        self._thread_local.chal = parse_dict_header(re.sub(r'digest ', '', www_authenticate, count=1, flags=re.I))
+        return True
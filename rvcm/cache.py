@@ -0,0 +1,153 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """
+    Page served from cache (the part of requests.Response used by parsers)
+    """
+
+    def __init__(self, url: str, text: str, status_code: int = 200):
+        self.url = url
+        self.text = text
+        self.status_code = status_code
+        self.encoding = 'utf-8'
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        for pos in range(0, len(self.text), chunk_size):
+            chunk = self.text[pos:pos + chunk_size]
+            yield chunk if decode_unicode else chunk.encode(self.encoding)
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(url=" + repr(self.url) + ", status_code=" + repr(self.status_code) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+# suffix of files being written
+_TMP_SUFFIX = '.tmp'
+
+
+class ResponseCache:
+    """
+    Cache of router pages keyed by router IP and URL: in-memory LRU with TTL and optional directory on disk
+    shared by processes. Thread-safe, so one cache may be used by many contexts
+    """
+
+    def __init__(self, ttl: float = 5.0, size: int = 128, ttls: dict = None, directory: str = None):
+        """
+        :param ttl: default time to live of page in seconds
+        :param size: maximum number of pages in memory
+        :param ttls: time to live by URL (overrides default)
+        :param directory: directory for cache on disk (None - memory only)
+        """
+        self.ttl = ttl
+        self.size = size
+        self.ttls = dict(ttls or {})
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+
+    def get(self, ip: str, url: str):
+        """
+        Get fresh page from cache
+        :return: text of page or None
+        """
+        ttl = self.ttls.get(url, self.ttl)
+        now = time.time()
+        with self._lock:
+            entry = self._pages.get((ip, url))
+            if entry is not None:
+                if now - entry[0] <= ttl:
+                    self._pages.move_to_end((ip, url))
+                    return entry[1]
+                del self._pages[(ip, url)]
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(ip, url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or now - entry.get('stamp', 0) > ttl:
+            return None
+        self._remember(ip, url, entry['stamp'], entry['text'])
+        return entry['text']
+
+    def put(self, ip: str, url: str, text: str):
+        """
+        Put page to cache
+        """
+        stamp = time.time()
+        self._remember(ip, url, stamp, text)
+        if self.directory is None:
+            return
+        path = self._path(ip, url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{}.{}.{}{}".format(path, os.getpid(), threading.get_ident(), _TMP_SUFFIX)
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'stamp': stamp, 'text': text}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except FileNotFoundError:
+            # directory was removed meanwhile: the page stays in memory only
+            pass
+
+    def invalidate(self, ip: str):
+        """
+        Drop all pages of the router
+        """
+        with self._lock:
+            for key in [key for key in self._pages if key[0] == ip]:
+                del self._pages[key]
+        if self.directory is None:
+            return
+        folder = os.path.dirname(self._path(ip, ''))
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                if name.endswith(_TMP_SUFFIX):
+                    # page being written by another process (put replaces it atomically)
+                    continue
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+
+    def _remember(self, ip, url, stamp, text):
+        with self._lock:
+            self._pages[(ip, url)] = (stamp, text)
+            self._pages.move_to_end((ip, url))
+            while len(self._pages) > self.size:
+                self._pages.popitem(last=False)
+
+    def _path(self, ip, url):
+        folder = ip.replace(':', '_').replace('/', '_')
+        return os.path.join(self.directory, folder, hashlib.sha1(url.encode('utf-8')).hexdigest())
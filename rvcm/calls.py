@@ -18,50 +18,51 @@ WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEM
 COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
-from typing import List
-from datetime import datetime
+from typing import List, Iterator, Iterable
+from datetime import datetime, timedelta
+from collections import Counter
+from itertools import compress
+from array import array
 from rvcm.cli import *
+from rvcm import trace
+from rvcm.formats import format_option, write_records
+from rvcm.records import Record, Field, int_field, datetime_field
 import re
 import json
 
 
-class Abonent:
+class Abonent(Record):
     """
     Keep IP and phone number
     """
+    __slots__ = ('phone', 'ip')
+    FIELDS = ('phone', 'ip')
 
-    def __init__(self, phone: str, ip: str):
+    def __init__(self, phone: str = '', ip: str = ''):
         self.phone = phone
         self.ip = ip
 
-    def __repr__(self):
-        return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
 
-    def __str__(self):
-        return repr(self)
-
-
-class Call:
+class Call(Record):
     """
-    Describe single call history record
+    Describe single call history record. Dictionary form is flat (as in calls export)
     """
+    __slots__ = ('line', 'direction', 'calling', 'called', 'duration', 'stamp', 'status')
+    FIELDS = (int_field('line'), 'direction', 'status',
+              Field('calling_phone', 'calling.phone'), Field('calling_ip', 'calling.ip'),
+              Field('called_phone', 'called.phone'), Field('called_ip', 'called.ip'),
+              int_field('duration'), datetime_field('stamp'))
 
-    def __init__(self, line: int, direction: str, calling: Abonent, called: Abonent, duration_seconds: int,
-                 stamp: datetime, status: str):
+    def __init__(self, line: int = 0, direction: str = '', calling: Abonent = None, called: Abonent = None,
+                 duration_seconds: int = 0, stamp: datetime = None, status: str = ''):
         self.line = line
         self.direction = direction
-        self.calling = calling
-        self.called = called
+        self.calling = calling or Abonent()
+        self.called = called or Abonent()
         self.duration = duration_seconds
-        self.stamp = stamp
+        self.stamp = stamp or _EPOCH
         self.status = status
 
-    def __repr__(self):
-        return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
-
-    def __str__(self):
-        return repr(self)
-
 
 class History:
     """
@@ -72,38 +73,100 @@ class History:
     def __init__(self, calls: List[Call] = None):
         self.calls = calls or []
 
+    # Example:
+    # "line 0, Answered, IN, Calling:0000000000000;cpc-rus=1;phone-cont(55.66.77.88),
+    # Called:+100000000(11.22.33.44), Duration:0h:15m:34s, Mon Nov 28 19:43:31 2016"
+    ABONENT_PATTERN = re.compile(r'(?P<phone>[0-9\+\-]+).*\((?P<ip>.*?)\)')
+    # Size of chunks read from router in streaming mode
+    CHUNK_SIZE = 16384
+
     def parse(self, page: str):
+        with trace.span('parse.calls') as fields:
+            self.calls = list(self.iter_calls(page))
+            fields['items'] = len(self.calls)
+
+    def parse_record(self, record: str) -> Call:
+        """
+        Parse single record of calls log
+        :param record: text of record
+        :return: call
+        """
+        line, status, direction, source, target, duration, stamp = map(str.strip, record.split(','))
+        line_num = int(line.split()[1])
+        calling_phone, calling_ip = self.ABONENT_PATTERN.findall(source.split(':')[1])[0]
+        called_phone, called_ip = self.ABONENT_PATTERN.findall(target.split(':')[1])[0]
+        _, span = duration.split(':', 1)
+        h, m, s = span.split(':')
+        seconds = int(h[:-1]) * 3600 + int(m[:-1]) * 60 + int(s[:-1])
+        return Call(
+            line=line_num,
+            direction=direction.upper(),
+            calling=Abonent(phone=calling_phone, ip=calling_ip),
+            called=Abonent(phone=called_phone, ip=called_ip),
+            duration_seconds=seconds,
+            stamp=datetime.strptime(stamp, '%a %b %d %H:%M:%S %Y'),
+            status=status
+        )
+
+    def iter_calls(self, page) -> Iterator[Call]:
+        """
+        Parse calls log incrementally: records are decoded one by one from `call_logs` array
+        as soon as they are available
+        :param page: content of calls page or iterable of its text chunks
+        :return: iterator of calls
+        """
         keyword = 'var call_logs ='
-        line = '[]'
-        for ln in page.splitlines():
-            index = ln.find(keyword)
+        chunks = iter([page] if isinstance(page, str) else page)
+        buffer = ''
+        for chunk in chunks:
+            buffer += chunk
+            index = buffer.find(keyword)
             if index != -1:
-                line = ln[index + len(keyword):-1]
+                buffer = buffer[index + len(keyword):]
                 break
-        records = json.loads(line)
-        # Example:
-        # "line 0, Answered, IN, Calling:0000000000000;cpc-rus=1;phone-cont(55.66.77.88),
-        # Called:+100000000(11.22.33.44), Duration:0h:15m:34s, Mon Nov 28 19:43:31 2016"
-        calls = []
-        abonent_pattern = re.compile(r'(?P<phone>[0-9\+\-]+).*\((?P<ip>.*?)\)')
-        for record in records:
-            line, status, direction, source, target, duration, stamp = map(str.strip, record.split(','))
-            line_num = int(line.split()[1])
-            calling_phone, calling_ip = abonent_pattern.findall(source.split(':')[1])[0]
-            called_phone, called_ip = abonent_pattern.findall(target.split(':')[1])[0]
-            _, span = duration.split(':', 1)
-            h, m, s = span.split(':')
-            seconds = int(h[:-1]) * 3600 + int(m[:-1]) * 60 + int(s[:-1])
-            calls.append(Call(
-                line=line_num,
-                direction=direction.upper(),
-                calling=Abonent(phone=calling_phone, ip=calling_ip),
-                called=Abonent(phone=called_phone, ip=called_ip),
-                duration_seconds=seconds,
-                stamp=datetime.strptime(stamp, '%a %b %d %H:%M:%S %Y'),
-                status=status
-            ))
-        self.calls = calls
+            buffer = buffer[-len(keyword):]
+        else:
+            return
+        decoder = json.JSONDecoder()
+        pos = 0
+        opened = False
+        while True:
+            while pos < len(buffer) and (buffer[pos] in ' \t\r\n,' or (not opened and buffer[pos] == '[')):
+                opened = opened or buffer[pos] == '['
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos == len(buffer):
+                    raise ValueError("need more data")
+                record, pos = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield self.parse_record(record)
+
+    def stream(self, requester: callable) -> Iterator[Call]:
+        """
+        Get calls from router one by one while the page is downloading
+        :param requester: function that returns response by url and accepts `stream` flag
+        :return: iterator of calls
+        """
+        resp = requester(self.URL, stream=True)
+        if resp.encoding is None:
+            resp.encoding = 'utf-8'
+        try:
+            chunks = resp.iter_content(chunk_size=self.CHUNK_SIZE, decode_unicode=True)
+            yield from trace.timed_iter('parse.calls', self.iter_calls(chunks), streamed=True)
+        finally:
+            raw = getattr(resp, 'raw', None)
+            if raw is not None:
+                # bytes of streamed page are known only when it is read
+                trace.count('bytes', raw.tell())
+            resp.close()
 
     def retrieve(self, requester: callable):
         """
@@ -115,6 +178,16 @@ class History:
         self.parse(resp.text)
         return self
 
+    async def retrieve_async(self, requester: callable):
+        """
+        Get information about calls from router asynchronously
+        :param requester: coroutine function that returns page by url (see rvcm.aio.AsyncContext)
+        :return: self
+        """
+        resp = await requester(self.URL)
+        self.parse(resp.text)
+        return self
+
     def __repr__(self):
         return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
 
@@ -122,6 +195,248 @@ class History:
         return repr(self)
 
 
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+class CallRow:
+    """
+    View of single row of CallTable with the same fields as in Call.to_dict
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table: 'CallTable', index: int):
+        self.table = table
+        self.index = index
+
+    @property
+    def line(self) -> int:
+        return self.table.line[self.index]
+
+    @property
+    def direction(self) -> str:
+        return self.table.directions[self.table.direction[self.index]]
+
+    @property
+    def status(self) -> str:
+        return self.table.statuses[self.table.status[self.index]]
+
+    @property
+    def calling_phone(self) -> str:
+        return self.table.strings[self.table.calling_phone[self.index]]
+
+    @property
+    def calling_ip(self) -> str:
+        return self.table.strings[self.table.calling_ip[self.index]]
+
+    @property
+    def called_phone(self) -> str:
+        return self.table.strings[self.table.called_phone[self.index]]
+
+    @property
+    def called_ip(self) -> str:
+        return self.table.strings[self.table.called_ip[self.index]]
+
+    @property
+    def duration(self) -> int:
+        return self.table.duration[self.index]
+
+    @property
+    def stamp(self) -> datetime:
+        return _EPOCH + timedelta(seconds=self.table.stamp[self.index])
+
+    def to_call(self) -> Call:
+        return Call(line=self.line,
+                    direction=self.direction,
+                    calling=Abonent(phone=self.calling_phone, ip=self.calling_ip),
+                    called=Abonent(phone=self.called_phone, ip=self.called_ip),
+                    duration_seconds=self.duration,
+                    stamp=self.stamp,
+                    status=self.status)
+
+    def to_dict(self):
+        return self.to_call().to_dict()
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + ", ".join(
+            "{}={!r}".format(name, getattr(self, name)) for name in CallTable.COLUMNS) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+class CallTable:
+    """
+    Compact columnar calls history: every field is a typed array, phones and IPs are interned into `strings`,
+    directions and statuses into own small lists, and stamps are kept as seconds since epoch. Rows are
+    available as CallRow views; aggregations run over whole columns
+    """
+    COLUMNS = ('line', 'direction', 'status', 'calling_phone', 'calling_ip', 'called_phone', 'called_ip',
+               'duration', 'stamp')
+    # Columns with ids of interned values -> list of values
+    LOOKUPS = {
+        'direction': 'directions',
+        'status': 'statuses',
+        'calling_phone': 'strings',
+        'calling_ip': 'strings',
+        'called_phone': 'strings',
+        'called_ip': 'strings',
+    }
+
+    def __init__(self):
+        self.line = array('H')
+        self.direction = array('B')
+        self.status = array('B')
+        self.calling_phone = array('I')
+        self.calling_ip = array('I')
+        self.called_phone = array('I')
+        self.called_ip = array('I')
+        self.duration = array('I')
+        self.stamp = array('q')
+        self.directions = []
+        self.statuses = []
+        self.strings = []
+        self._ids = {}
+
+    @classmethod
+    def from_calls(cls, calls: Iterable[Call]) -> 'CallTable':
+        """
+        Build table from calls (History.calls, History.stream or CallStore.calls)
+        """
+        table = cls()
+        for call in calls:
+            table.append(call)
+        return table
+
+    def append(self, call: Call):
+        self.append_row(call.line, call.direction, call.status, call.calling.phone, call.calling.ip,
+                        call.called.phone, call.called.ip, call.duration, (call.stamp - _EPOCH) // _SECOND)
+
+    def append_row(self, line: int, direction: str, status: str, calling_phone: str, calling_ip: str,
+                   called_phone: str, called_ip: str, duration: int, stamp: int):
+        """
+        Add row by plain values
+        :param stamp: start of call in seconds since epoch
+        """
+        ids = self._ids
+        intern = self._intern
+        self.line.append(line)
+        self.direction.append(self._code(self.directions, direction))
+        self.status.append(self._code(self.statuses, status))
+        self.calling_phone.append(ids[calling_phone] if calling_phone in ids else intern(calling_phone))
+        self.calling_ip.append(ids[calling_ip] if calling_ip in ids else intern(calling_ip))
+        self.called_phone.append(ids[called_phone] if called_phone in ids else intern(called_phone))
+        self.called_ip.append(ids[called_ip] if called_ip in ids else intern(called_ip))
+        self.duration.append(duration)
+        self.stamp.append(stamp)
+
+    def _intern(self, value: str) -> int:
+        index = self._ids[value] = len(self.strings)
+        self.strings.append(value)
+        return index
+
+    @staticmethod
+    def _code(values: list, value: str) -> int:
+        if value in values:
+            return values.index(value)
+        if len(values) > 255:
+            raise ValueError("too many distinct values: " + repr(value))
+        values.append(value)
+        return len(values) - 1
+
+    def filter(self, status: str = None, direction: str = None, since: datetime = None) -> 'CallTable':
+        """
+        Rows matching all given conditions as new table (interned values are shared)
+        """
+        mask = None
+        for column, values, value in (('status', self.statuses, status), ('direction', self.directions, direction)):
+            if value is None:
+                continue
+            code = values.index(value) if value in values else -1
+            mask = self._and(mask, (item == code for item in getattr(self, column)))
+        if since is not None:
+            start = (since - _EPOCH) // _SECOND
+            mask = self._and(mask, (item >= start for item in self.stamp))
+        if mask is None:
+            return self
+        mask = list(mask)
+        table = self.__class__()
+        table.directions, table.statuses, table.strings, table._ids = \
+            self.directions, self.statuses, self.strings, self._ids
+        for column in self.COLUMNS:
+            getattr(table, column).extend(compress(getattr(self, column), mask))
+        return table
+
+    @staticmethod
+    def _and(mask, condition):
+        return condition if mask is None else map(bool.__and__, mask, condition)
+
+    def durations(self, percentiles=(50, 90, 95, 99)) -> dict:
+        """
+        Summary of durations: count, total, mean, min, max and percentiles (nearest rank)
+        """
+        from collections import OrderedDict
+        values = sorted(self.duration)
+        count = len(values)
+        total = sum(values)
+        summary = OrderedDict([
+            ("count", count),
+            ("total", total),
+            ("mean", round(total / count, 3) if count else 0),
+            ("min", values[0] if count else 0),
+            ("max", values[-1] if count else 0),
+        ])
+        for percentile in percentiles:
+            rank = max(0, -(-percentile * count // 100) - 1)
+            summary["p{}".format(percentile)] = values[rank] if count else 0
+        return summary
+
+    def counts(self, column: str, top: int = None) -> list:
+        """
+        Number of rows by value of column, most common first
+        :param column: one of COLUMNS
+        :param top: only this number of most common values
+        :return: list of (value, count)
+        """
+        if column not in self.COLUMNS:
+            raise ValueError("unknown column: " + column)
+        counter = Counter(getattr(self, column))
+        values = getattr(self, self.LOOKUPS[column]) if column in self.LOOKUPS else None
+        return [(values[key] if values is not None else key, count) for key, count in counter.most_common(top)]
+
+    def hourly(self) -> list:
+        """
+        Histogram by hour of day
+        :return: list of 24 (calls, total duration) tuples
+        """
+        hours = [stamp // 3600 % 24 for stamp in self.stamp]
+        calls = Counter(hours)
+        durations = [0] * 24
+        for hour, duration in zip(hours, self.duration):
+            durations[hour] += duration
+        return [(calls[hour], durations[hour]) for hour in range(24)]
+
+    def __len__(self):
+        return len(self.stamp)
+
+    def __getitem__(self, index: int) -> CallRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return CallRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CallRow(self, index)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(rows=" + str(len(self)) + ", strings=" + str(len(self.strings)) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
 @cli.group()
 def calls():
     """
@@ -130,9 +445,29 @@ def calls():
     pass
 
 
+def _history(ctx, db: str, since: datetime):
+    """
+    Calls from local store (if db set) or streamed from router
+    """
+    if db:
+        from rvcm.store import CallStore
+        with CallStore(db) as store:
+            yield from store.calls(router=ctx.obj.ip, since=since)
+        return
+    for call in History().stream(ctx.obj.getter):
+        if since is None or call.stamp >= since:
+            yield call
+
+
+_db_option = click.option('--db', default=None, help='Read calls from local store (see collect) instead of router')
+_since_option = click.option('--since', type=click.DateTime(), default=None, help='Only calls since the time')
+
+
 @calls.command()
+@_db_option
+@_since_option
 @click.pass_context
-def info(ctx):
+def info(ctx, db, since):
     """Print calls history"""
     line = "{line:4}" \
            " {direction:9}" \
@@ -155,8 +490,7 @@ def info(ctx):
         stamp='STAMP'
 
     ))
-    history = History().retrieve(ctx.obj.getter)
-    for call in history.calls:
+    for call in _history(ctx, db, since):
         print(line.format(
             line=call.line,
             direction=call.direction,
@@ -171,26 +505,51 @@ def info(ctx):
 
 
 @calls.command()
+@_db_option
+@_since_option
+@format_option
+@click.pass_context
+def export(ctx, db, since, fmt):
+    """Print calls history in JSON, NDJSON, CSV or MessagePack"""
+    write_records(_history(ctx, db, since), fmt)
+
+
+@calls.command()
+@_db_option
+@_since_option
+@click.option('--status', default=None, help='Only calls with the status (like Answered or Missed)')
+@click.option('--direction', default=None, help='Only calls in the direction (IN or OUT)')
+@click.option('--by', multiple=True, default=['status', 'direction'], type=click.Choice(CallTable.COLUMNS[:-2]),
+              help='Count calls by the field (may be repeated)')
+@click.option('--top', type=int, default=10, help='Number of most common values in counts')
 @click.pass_context
-def export(ctx):
-    """Print calls history in JSON"""
-    history = History().retrieve(ctx.obj.getter)
-    data = []
+def stats(ctx, db, since, status, direction, by, top):
+    """Print statistics of calls history in JSON"""
     from collections import OrderedDict
-    for call in history.calls:
-        data.append(OrderedDict([
-            ("line", call.line),
-            ("direction", call.direction),
-            ("status", call.status),
-            ("calling_phone", call.calling.phone),
-            ("calling_ip", call.calling.ip),
-            ("called_phone", call.called.phone),
-            ("called_ip", call.called.ip),
-            ("duration", call.duration),
-            ("stamp", call.stamp.isoformat('T'))
-        ]
-        ))
-    print(json.dumps(data, ensure_ascii=False, indent=4))
+    if db:
+        from rvcm.store import CallStore
+        with CallStore(db) as store:
+            table = store.table(router=ctx.obj.ip, since=since)
+    else:
+        table = CallTable.from_calls(_history(ctx, None, since))
+    table = table.filter(status=status, direction=direction)
+    result = OrderedDict([("calls", len(table)), ("duration", table.durations())])
+    for column in by:
+        result["by_" + column] = OrderedDict((str(value), count) for value, count in table.counts(column, top))
+    result["hourly"] = [OrderedDict([("hour", hour), ("calls", count), ("duration", duration)])
+                        for hour, (count, duration) in enumerate(table.hourly())]
+    print(json.dumps(result, ensure_ascii=False, indent=4))
+
+
+@calls.command()
+@click.option('--db', required=True, help='Path to SQLite database')
+@click.pass_context
+def collect(ctx, db):
+    """Save new calls from router into local store"""
+    from rvcm.store import CallStore
+    with CallStore(db) as store:
+        inserted = store.collect(ctx.obj.ip, History().stream(ctx.obj.getter))
+    print("{} new calls".format(inserted))
 
 
 if __name__ == '__main__':
@@ -18,35 +18,391 @@ WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEM
 COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
+import threading
+import importlib
 import click
-import requests
-from requests.auth import HTTPDigestAuth
+from rvcm import trace
+
+
+class RouterError(Exception):
+    """
+    Base error of communication with router
+    """
+
+    def __init__(self, ip: str, url: str, message: str):
+        super().__init__("{}{}: {}".format(ip, url, message))
+        self.ip = ip
+        self.url = url
+
+
+class RouterTimeout(RouterError):
+    """
+    Router did not connect or answer in time
+    """
+
+
+class RouterUnavailable(RouterError):
+    """
+    Connection to router failed
+    """
+
+
+class RouterHTTPError(RouterError):
+    """
+    Router answered with unexpected HTTP status
+    """
+
+    def __init__(self, ip: str, url: str, status_code: int, text: str = ''):
+        # pages are long HTML documents: keep only the beginning in the message
+        summary = ' '.join(text.split())[:120]
+        super().__init__(ip, url, "HTTP {}{}".format(status_code, " " + summary if summary else ""))
+        self.status_code = status_code
+        self.text = text
+
+
+class AuthenticationError(RouterHTTPError):
+    """
+    Router rejected login name or password
+    """
+
+
+def check_status(ip: str, url: str, status_code: int, text: str = ''):
+    """
+    Raise typed error if router answered not with 200
+    """
+    if status_code == 401:
+        raise AuthenticationError(ip, url, status_code, text)
+    if status_code != 200:
+        raise RouterHTTPError(ip, url, status_code, text)
+
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+def router_slots(ip: str, concurrency: int):
+    """
+    Semaphore limiting requests to the router from the whole process. It is created by the first caller,
+    later callers with the same IP share it whatever concurrency they ask
+    :param ip: router address
+    :param concurrency: maximum number of requests to the router at the same time
+    """
+    with _slots_lock:
+        if ip not in _slots:
+            _slots[ip] = threading.BoundedSemaphore(concurrency)
+        return _slots[ip]
+
+
+def _release_on_close(resp, release: callable):
+    # streamed body is read after request returns: the slot is held until the response is closed
+    close = resp.close
+    released = []
+
+    def closing():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                release()
+
+    resp.close = closing
+    return resp
 
 
 class Context:
-    def __init__(self, ip, user, password):
-        self.auth = HTTPDigestAuth(user, password)
+    """
+    Connection to single router: keeps one pooled keep-alive HTTP session and Digest state for all requests.
+    Close it (or use it as context manager) when it is no longer needed.
+
+    GET requests failed by timeout, connection error or 5xx/429 status are retried up to `retries` times after
+    exponential backoff with full jitter; POST requests are never retried. Requests to the same router from
+    all contexts of the process are limited by `concurrency`
+    """
+    # Statuses of GET requests worth retrying
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # Maximum delay between retries in seconds
+    MAX_BACKOFF = 10.0
+
+    def __init__(self, ip, user, password, pool_size=4, timeout=30.0, cache=None, connect_timeout=5.0, retries=2,
+                 backoff=0.5, concurrency=2):
+        """
+        :param pool_size: maximum number of kept connections
+        :param timeout: timeout of reading response in seconds (None - wait forever)
+        :param cache: rvcm.cache.ResponseCache for pages (None - no caching)
+        :param connect_timeout: timeout of connection in seconds (None - wait forever)
+        :param retries: number of retries of failed GET request
+        :param backoff: base delay before first retry in seconds, doubled for each next retry
+        :param concurrency: maximum number of requests to the router at the same time (0 - unlimited)
+        """
+        self.user = user
+        self.password = password
         self.url = "http://" + ip
         self.ip = ip
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.slots = router_slots(ip, concurrency) if concurrency else None
+        self._session = None
+        self._lock = threading.Lock()
 
-    def getter(self, url):
-        resp = requests.get(self.url + url, auth=self.auth)
-        assert resp.status_code == 200, resp.text
-        return resp
+    @property
+    def session(self):
+        """
+        HTTP session with Digest auth (requests is imported only when the router is really contacted)
+        """
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from rvcm.auth import DigestAuth
+                session = requests.Session()
+                session.auth = DigestAuth(self.user, self.password)
+                session.mount('http://', trace.instrument_adapter(
+                    HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)))
+                self._session = session
+            return self._session
+
+    @property
+    def auth(self):
+        return self.session.auth
+
+    def getter(self, url, stream=False, fresh=False):
+        """
+        Get page of router (from cache if it's enabled)
+        :param url: page URL relative to router
+        :param stream: don't read body at once (ignored with cache)
+        :param fresh: always request router (cached page is replaced), e.g. to check state before save
+        """
+        if self.cache is not None:
+            from rvcm.cache import CachedResponse
+            text = None if fresh else self.cache.get(self.ip, url)
+            if text is not None:
+                trace.count('cache_hits')
+            else:
+                text = self._get(url, False).text
+                self.cache.put(self.ip, url, text)
+            return CachedResponse(url, text)
+        return self._get(url, stream)
+
+    def _get(self, url, stream):
+        import random
+        import time
+        for attempt in range(self.retries + 1):
+            if attempt:
+                trace.count('retries')
+                time.sleep(random.uniform(0, min(self.MAX_BACKOFF, self.backoff * 2 ** (attempt - 1))))
+            try:
+                resp = self._request('GET', url, stream=stream)
+            except (RouterTimeout, RouterUnavailable):
+                if attempt == self.retries:
+                    raise
+                continue
+            if resp.status_code in self.RETRY_STATUSES and attempt < self.retries:
+                resp.close()
+                continue
+            try:
+                check_status(self.ip, url, resp.status_code, resp.text if resp.status_code != 200 else '')
+            except RouterError:
+                resp.close()
+                raise
+            return resp
 
     def poster(self, url, data, referer=""):
-        resp = requests.post(self.url + url, data=data, auth=self.auth,
-                             headers={
-                                 'Referer': self.url + referer
-                             })
-        t = resp.text
-        assert resp.status_code == 200, t
+        resp = self._request('POST', url, data=data, headers={
+            'Referer': self.url + referer
+        })
+        check_status(self.ip, url, resp.status_code, resp.text)
+        if self.cache is not None:
+            # any change of settings may change every page (at least the apply-required banner)
+            self.cache.invalidate(self.ip)
+        return resp
+
+    def _request(self, method, url, **kwargs):
+        """
+        Make request within concurrency limit of the router translating transport errors to RouterError
+        """
+        import requests
+        slots = self.slots
+        if slots is not None:
+            slots.acquire()
+        held = False
+        try:
+            with trace.span('http.request', router=self.ip, method=method, url=url) as fields:
+                trace.count('requests')
+                try:
+                    resp = self.session.request(method, self.url + url, timeout=(self.connect_timeout, self.timeout),
+                                                **kwargs)
+                except requests.exceptions.Timeout as ex:
+                    trace.count('errors')
+                    raise RouterTimeout(self.ip, url, "timed out ({})".format(ex.__class__.__name__)) from ex
+                except requests.exceptions.ConnectionError as ex:
+                    trace.count('errors')
+                    raise RouterUnavailable(self.ip, url, "connection failed ({})".format(
+                        ex.__class__.__name__)) from ex
+                fields['status'] = resp.status_code
+                if not kwargs.get('stream'):
+                    fields['bytes'] = len(resp.content)
+                    trace.count('bytes', fields['bytes'])
+                elif slots is not None:
+                    held = True
+                    return _release_on_close(resp, slots.release)
+                return resp
+        finally:
+            if slots is not None and not held:
+                slots.release()
+
+    def close(self):
+        """
+        Release pooled connections
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Cli(click.Group):
+    """
+    Root group of commands. With inventory it runs the chosen subcommand for every router of the fleet
+    """
+    # Commands executed once per router; others (like serve) handle inventory by themselves
+    FLEET_COMMANDS = ('router', 'nat', 'calls', 'snapshot')
+    # Commands loaded only when used: name -> (module, short help)
+    LAZY_COMMANDS = {
+        'router': ('rvcm.router', 'Direct router operations'),
+        'nat': ('rvcm.nat', 'NAT operations'),
+        'calls': ('rvcm.calls', 'Calls operations'),
+        'snapshot': ('rvcm.snapshot', 'Print info, NAT rules and calls of router in one JSON document'),
+        'serve': ('rvcm.serve', 'Serve router (or whole inventory) state as JSON API'),
+        'exporter': ('rvcm.exporter', 'Serve router (or whole inventory) metrics for Prometheus'),
+        'emulator': ('rvcm.emulator', 'Emulate routers for load and latency testing'),
+    }
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands) | set(self.LAZY_COMMANDS))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.LAZY_COMMANDS:
+            importlib.import_module(self.LAZY_COMMANDS[cmd_name][0])
+        return self.commands.get(cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        # help of not loaded commands is taken from LAZY_COMMANDS, so --help imports nothing
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                cmd = self.commands[name]
+                if cmd.hidden:
+                    continue
+                rows.append((name, cmd.get_short_help_str(formatter.width - 6 - len(name))))
+            else:
+                rows.append((name, self.LAZY_COMMANDS[name][1]))
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+    def invoke(self, ctx):
+        _instrument(ctx)
+        # click >= 8.2 keeps subcommand name in private attribute
+        args = list(ctx.__dict__.get('_protected_args', ctx.__dict__.get('protected_args', []))) + ctx.args
+        if ctx.params.get('inventory') is None or not args or args[0] not in self.FLEET_COMMANDS:
+            try:
+                return super().invoke(ctx)
+            except RouterError as ex:
+                raise click.ClickException("{}: {}".format(ex.__class__.__name__, ex)) from ex
+        from rvcm.fleet import Fleet, targets
+        fleet = Fleet(targets(ctx.params), context_factory(ctx.params), parallel=ctx.params['parallel'])
+        with ctx:
+            if not fleet.run(self, ctx, args, ndjson=ctx.params['fleet_format'] == 'ndjson'):
+                ctx.exit(1)
+
+
+def _instrument(ctx):
+    # hooks of --trace and --profile live until the root command is finished
+    import sys
+    path = ctx.params.get('trace_file')
+    if path:
+        stream = click.open_file(path, 'w', lazy=False) if path != '-' else sys.stderr
+        hook = trace.JsonLines(stream)
+        trace.add_hook(hook)
+        ctx.call_on_close(lambda: trace.remove_hook(hook))
+        if stream is not sys.stderr:
+            ctx.call_on_close(stream.close)
+    if ctx.params.get('profile'):
+        profile = trace.Profile()
+        trace.add_hook(profile)
+
+        def report():
+            trace.remove_hook(profile)
+            sys.stderr.write(profile.report() + "\n")
+
+        ctx.call_on_close(report)
+
+
+def context_factory(params: dict) -> callable:
+    """
+    Make function that creates Context for rvcm.fleet.Target with settings from options of root command
+    :param params: parameters of root command
+    """
+    cache = _cache(params['cache_ttl'], params['cache_dir'])
+
+    def factory(target):
+        return Context(target.ip, target.user, target.password, cache=cache, **_connection(params))
+
+    return factory
+
+
+def _connection(params: dict) -> dict:
+    return dict(timeout=params['timeout'] or None, connect_timeout=params['connect_timeout'] or None,
+                retries=params['retries'], concurrency=params['router_concurrency'])
+
+
+def _cache(ttl, directory):
+    if not ttl:
+        return None
+    from rvcm.cache import ResponseCache
+    return ResponseCache(ttl=ttl, directory=directory)
 
 
-@click.group()
+@click.group(cls=Cli)
 @click.option('--ip', envvar='RC_IP', default="", help='Router IP')
 @click.option('--user', envvar='RC_USER', default="admin", help='Login name')
 @click.option('--password', envvar='RC_PASSWORD', default="admin", help='Password')
+@click.option('--timeout', envvar='RC_TIMEOUT', type=float, default=30.0,
+              help='Timeout of router response in seconds (0 - wait forever)')
+@click.option('--connect-timeout', envvar='RC_CONNECT_TIMEOUT', type=float, default=5.0,
+              help='Timeout of connection to router in seconds (0 - wait forever)')
+@click.option('--retries', envvar='RC_RETRIES', type=int, default=2,
+              help='Retries of failed page downloads (with exponential backoff and jitter)')
+@click.option('--router-concurrency', envvar='RC_ROUTER_CONCURRENCY', type=int, default=2,
+              help='Requests to one router at the same time (0 - unlimited)')
+@click.option('--cache-ttl', envvar='RC_CACHE_TTL', type=float, default=0,
+              help='Reuse pages downloaded less than this number of seconds ago (0 - disabled)')
+@click.option('--cache-dir', envvar='RC_CACHE_DIR', default=None,
+              help='Keep cached pages in the directory to share them between runs')
+@click.option('--inventory', envvar='RC_INVENTORY', default=None,
+              help='File with routers (IP USER PASSWORD TAGS per line or JSON) to run command for all of them')
+@click.option('--tag', multiple=True, help='Use only routers from inventory with this tag')
+@click.option('--parallel', envvar='RC_PARALLEL', type=int, default=16, help='Routers processed at the same time')
+@click.option('--fleet-format', type=click.Choice(['json', 'ndjson']), default='json',
+              help='Merged output of inventory run: JSON keyed by router or NDJSON as results complete')
+@click.option('--pending-file', envvar='RC_PENDING_FILE', default=None,
+              help='State file of deferred applies (default ~/.cache/rvcm/pending.json)')
+@click.option('--profile', is_flag=True, help='Print time spent in each phase (requests, parsing...) to stderr')
+@click.option('--trace', 'trace_file', envvar='RC_TRACE', default=None,
+              help='Write timing spans as JSON lines to the file (- for stderr)')
 @click.pass_context
-def cli(ctx, ip, user, password):
-    ctx.obj = Context(ip, user, password)
+def cli(ctx, ip, user, password, timeout, connect_timeout, retries, router_concurrency, cache_ttl, cache_dir, inventory,
+        tag, parallel, fleet_format, pending_file, profile, trace_file):
+    ctx.obj = Context(ip, user, password, cache=_cache(cache_ttl, cache_dir), **_connection(ctx.params))
+    ctx.call_on_close(ctx.obj.close)
@@ -0,0 +1,504 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Emulator of RV6688BCM routers for load and latency testing: local HTTP server with Digest authorization
+which serves status, NAT and calls pages in the router format and accepts the same setup.cgi forms.
+Many routers are emulated by one server, each under own path prefix: router `r0001` of server on
+127.0.0.1:8680 is used as `--ip 127.0.0.1:8680/r0001`.
+"""
+import sys
+import json
+import time
+import html
+import random
+import hashlib
+import datetime
+import threading
+import contextlib
+import socketserver
+from typing import List
+from urllib.parse import parse_qsl
+from urllib.request import parse_http_list, parse_keqv_list
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from rvcm.cli import *
+from rvcm.router import Info
+from rvcm.nat import NAT, Forward, ForwardType
+
+REALM = 'RV6688BCM'
+
+INDEX_PAGE = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>{model}</title>
+<script type="text/javascript">
+var headMsg = "{head_msg}";
+</script>
+</head>
+<body>
+<div id="content">
+<form name="frm" method="post" action="setup.cgi">
+<input type="hidden" name="todo" value="">
+<input type="hidden" name="this_file" value="index.htm">
+<input type="hidden" name="next_file" value="index.htm">
+<table class="main" width="100%" cellspacing="0" cellpadding="0">
+<tr><td class="title">Internet</td></tr>
+<tr><td>
+<table class="data" width="100%">
+<tr><th colspan="4">WAN</th></tr>
+<tr><td class="label">Connection Type</td><td>IPoE</td><td class="label">Status</td><td><script>document.write("{wan_status}");</script></td></tr>
+<tr><td class="label">IP Address</td><td>{ip}</td><td class="label">Default Gateway</td><td>{gateway}</td></tr>
+<tr><td class="label">Primary DNS</td><td>{dns1}</td><td class="label">Secondary DNS</td><td>{dns2}</td></tr>
+</table>
+</td></tr>
+<tr><td class="title">Telephony</td></tr>
+<tr><td>
+<table class="data" width="100%">
+<tr><th colspan="4">VoIP</th></tr>
+<tr><td class="label">Line</td><td>1</td><td class="label">Codec</td><td>G.711A</td></tr>
+<tr><td class="label">Registration</td><td><script>document.write("{phone_status}");</script></td><td class="label">Proxy</td><td>sip.example.net</td></tr>
+<tr><td class="label">SIP Account</td><td>{sip_user}</td><td class="label"></td><td></td></tr>
+</table>
+</td></tr>
+<tr><td class="title">Device</td></tr>
+<tr><td>
+<table class="data" width="100%">
+<tr><th colspan="4">Device Information</th></tr>
+<tr><td class="label">Model</td><td>{model}</td><td class="label">Firmware Version</td><td>{firmware}</td></tr>
+<tr><td class="label">GPON Serial</td><td>{gpon_serial}</td><td class="label">MAC Address</td><td>{mac}</td></tr>
+</table>
+</td></tr>
+<tr><td class="title">Local Network</td></tr>
+<tr><td>
+<table class="data" width="100%">
+<tr><th colspan="4">LAN</th></tr>
+<tr><td class="label">IP Address</td><td>{local_ip}</td><td class="label">Status</td><td><script>document.write("{lan_status}");</script></td></tr>
+</table>
+</td></tr>
+</table>
+</form>
+</div>
+</body>
+</html>
+'''
+
+NAT_PAGE = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>RV6688BCM</title>
+<script type="text/javascript">
+var headMsg = "{head_msg}";
+var vs_list = "{vs_list}";
+</script>
+</head>
+<body>
+<form name="frm" method="post" action="setup.cgi">
+<input type="hidden" name="h_vs_list" value="">
+<input type="hidden" name="todo" value="">
+<input type="hidden" name="this_file" value="vs.htm">
+<input type="hidden" name="next_file" value="vs.htm">
+</form>
+</body>
+</html>
+'''
+
+CALLS_PAGE = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>RV6688BCM</title>
+<script type="text/javascript">
+var call_logs = [{call_logs}];
+</script>
+</head>
+<body>
+</body>
+</html>
+'''
+
+APPLY_MESSAGE = 'Please do Apply to make the changes take effect.'
+
+
+class Router:
+    """
+    State of single emulated router
+    """
+
+    def __init__(self, info: Info = None, nat: NAT = None, calls: List[str] = None):
+        """
+        :param info: status of router (apply_required is kept up to date by posted forms)
+        :param nat: table of port forwarding rules
+        :param calls: records of calls log in router format, newest first
+        """
+        self.info = info or Info()
+        self.nat = nat or NAT()
+        self.calls = calls or []
+        self.lock = threading.Lock()
+
+    def page(self, name: str):
+        """
+        Render page
+        :param name: file name of page (index.htm, vs.htm or voice_call_logs.htm)
+        :return: text of page or None if there is no such page
+        """
+        with self.lock:
+            if name in ('index.htm', 'index.html'):
+                return self._index_page()
+            if name == 'vs.htm':
+                rules = self.nat.vs_list() if self.nat.forwards else ''
+                return NAT_PAGE.format(head_msg=self._head_msg(), vs_list=rules)
+            if name == 'voice_call_logs.htm':
+                return CALLS_PAGE.format(call_logs=', '.join('"' + record + '"' for record in self.calls))
+        return None
+
+    def post(self, fields: dict) -> str:
+        """
+        Process submitted setup.cgi form (save of NAT table or apply of saved changes)
+        :param fields: form fields
+        :return: file name of page to show next
+        """
+        todo = fields.get('todo')
+        with self.lock:
+            if todo == 'save' and fields.get('this_file') == 'vs.htm':
+                self.nat.forwards = self._forwards(fields)
+                self.info.apply_required = True
+            elif todo == 'apply':
+                self.info.apply_required = False
+            else:
+                raise ValueError("unsupported form: todo={!r} this_file={!r}".format(todo, fields.get('this_file')))
+        return fields.get('next_file') or 'index.htm'
+
+    @staticmethod
+    def _forwards(fields: dict) -> List[Forward]:
+        forwards = []
+        i = 0
+        while 'description_%s' % i in fields:
+            forwards.append(Forward(
+                name=fields['description_%s' % i],
+                enabled=fields['enable_%s' % i] != '0',
+                src_min_port=int(fields['inbound_port_low_%s' % i]),
+                src_max_port=int(fields['inbound_port_high_%s' % i]),
+                type=ForwardType(int(fields['type_%s' % i])),
+                dest_min_port=int(fields['private_port_low_%s' % i]),
+                dest_max_port=int(fields['private_port_high_%s' % i]),
+                dest_ip_sec=int(fields['private_ip_%s' % i])))
+            i += 1
+        return forwards
+
+    def _head_msg(self):
+        return APPLY_MESSAGE if self.info.apply_required else ''
+
+    def _index_page(self):
+        info = self.info
+        fields = {name: html.escape(str(getattr(info, name))) for name in info.__slots__}
+        fields.update(head_msg=self._head_msg(),
+                      wan_status='Up' if info.wan_line_up else 'Down',
+                      phone_status='Up' if info.phone_line_up else 'Down',
+                      lan_status='Connected' if info.lan_line_up else 'Disconnected')
+        return INDEX_PAGE.format(**fields)
+
+    @classmethod
+    def synthetic(cls, number: int = 0, rules: int = 10, calls: int = 20, seed: int = 1):
+        """
+        Make router with generated state. The same arguments give the same state
+        :param number: number of router (makes addresses and serials unique)
+        :param rules: number of NAT rules
+        :param calls: number of calls log records
+        :param seed: random seed
+        """
+        info = Info(ip='10.{}.{}.{}'.format(number // 65536 % 256, number // 256 % 256, number % 256 or 1),
+                    gateway='10.0.0.1', mac='00:1A:2B:{:02X}:{:02X}:{:02X}'.format(
+                number // 65536 % 256, number // 256 % 256, number % 256),
+                    sip_user='7495{:07d}'.format(number), local_ip='192.168.100.1', dns1='8.8.8.8', dns2='8.8.4.4',
+                    firmware='RV6688BCM_1.0.8', model='RV6688BCM', gpon_serial='RVBC{:08X}'.format(number),
+                    phone_line_up=True, wan_line_up=True, lan_line_up=True)
+        nat = NAT()
+        nat.parse('var vs_list = "' + vs_list(rules, seed + number) + '";')
+        return cls(info, nat, call_records(calls, seed + number))
+
+
+def vs_list(count: int, seed: int = 1) -> str:
+    """
+    Generate NAT table with non-overlapping rules
+    :param count: number of rules
+    :param seed: random seed
+    :return: value in router format (as vs_list variable of NAT page)
+    """
+    rnd = random.Random(seed)
+    rules = []
+    port = 1024
+    for i in range(count):
+        size = rnd.choice([1, 1, 1, 2, 10])
+        rules.append('{}-rule{}-{}-{}-{}-{}-{}-{}-0-'.format(rnd.randint(0, 1), i, port, port + size - 1,
+                                                             rnd.randint(1, 3), port, port + size - 1,
+                                                             rnd.randint(2, 254)))
+        port += size
+        if port + 10 > 65535:
+            port = 1024
+    return ''.join(rule + ';' for rule in rules)
+
+
+def call_records(count: int, seed: int = 1) -> List[str]:
+    """
+    Generate calls log
+    :param count: number of records
+    :param seed: random seed
+    :return: records in router format, newest first
+    """
+    rnd = random.Random(seed)
+    stamp = datetime.datetime(2016, 11, 28, 20, 0, 0)
+    records = []
+    for _ in range(count):
+        direction = rnd.choice(['IN', 'OUT'])
+        status = rnd.choice(['Answered', 'Missed'])
+        duration = rnd.randint(1, 7200) if status == 'Answered' else 0
+        local = '+1000000{:02d}(11.22.33.44)'.format(rnd.randint(0, 1))
+        remote = '+7{:010d}(55.66.77.{})'.format(rnd.randint(0, 9999999999), rnd.randint(1, 254))
+        calling, called = (remote, local) if direction == 'IN' else (local, remote)
+        records.append('line {}, {}, {}, Calling:{}, Called:{}, Duration:{}h:{}m:{}s, {}'.format(
+            rnd.randint(0, 1), status, direction, calling, called,
+            duration // 3600, duration // 60 % 60, duration % 60, stamp.strftime('%a %b %d %H:%M:%S %Y')))
+        stamp -= datetime.timedelta(seconds=rnd.randint(1, 600))
+    return records
+
+
+def _md5(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Router pages behind Digest authorization. First segment of path selects router; requests without
+    known prefix go to the first router
+    """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately: without it every response waits for delayed ACK of client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?')[0]
+        prefix, _, name = path.strip('/').partition('/')
+        router = server.routers.get(prefix)
+        if router is None:
+            router, name = server.default, path.strip('/')
+        if router is None:
+            return self._reply(404, '')
+        server.count('requests')
+        with server.slot(prefix):
+            server.delay()
+            failure = server.failure()
+            if failure is not None:
+                server.count('failures')
+                if failure == 0:
+                    # drop connection without response
+                    self.close_connection = True
+                    return
+                return self._reply(failure, '')
+            if not self._authorized(server):
+                server.count('unauthorized')
+                return self._reply(401, '', {'WWW-Authenticate': 'Digest realm="{}", nonce="{}", qop="auth", '
+                                                                 'algorithm=MD5'.format(REALM, server.nonce)})
+            if self.command == 'POST':
+                server.count('posts')
+                if name != 'setup.cgi':
+                    return self._reply(404, '')
+                try:
+                    name = router.post(dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True)))
+                except (ValueError, KeyError) as ex:
+                    return self._reply(400, str(ex))
+            page = router.page(name)
+        if page is None:
+            return self._reply(404, '')
+        self._reply(200, page)
+
+    def _authorized(self, server):
+        header = self.headers.get('Authorization', '')
+        if not header.startswith('Digest '):
+            return False
+        fields = parse_keqv_list(parse_http_list(header[7:]))
+        if fields.get('nonce') != server.nonce or fields.get('uri') != self.path or 'response' not in fields:
+            return False
+        ha1 = _md5('{}:{}:{}'.format(server.user, REALM, server.password))
+        ha2 = _md5('{}:{}'.format(self.command, fields['uri']))
+        expected = _md5(':'.join([ha1, fields['nonce'], fields.get('nc', ''), fields.get('cnonce', ''),
+                                  fields.get('qop', ''), ha2]))
+        return fields.get('username') == server.user and fields['response'] == expected
+
+    def _reply(self, code, text, headers=None):
+        content = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Emulator(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTP server emulating routers
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, routers: dict, listen: str = '127.0.0.1:0', user: str = 'admin', password: str = 'admin',
+                 latency: float = 0.0, jitter: float = 0.0, concurrency: int = 0, failure_rate: float = 0.0,
+                 failure_status: int = 503, seed: int = None, verbose: bool = False):
+        """
+        :param routers: emulated routers by path prefix
+        :param listen: host:port to listen (port 0 - any free)
+        :param user: login name accepted by all routers
+        :param password: password accepted by all routers
+        :param latency: delay of every response in seconds
+        :param jitter: maximum random addition to latency in seconds
+        :param concurrency: requests processed by one router at the same time, others wait (0 - unlimited)
+        :param failure_rate: fraction of requests which fail (after latency)
+        :param failure_status: HTTP status of failed requests (0 - drop connection)
+        :param seed: random seed of jitter and failures
+        """
+        host, _, port = listen.rpartition(':')
+        super().__init__((host or '127.0.0.1', int(port)), Handler)
+        self.routers = routers
+        self.default = next(iter(routers.values()), None)
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.verbose = verbose
+        self.nonce = hashlib.sha1(str(random.random()).encode()).hexdigest()
+        self.stats = {'requests': 0, 'unauthorized': 0, 'failures': 0, 'posts': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    @property
+    def address(self) -> str:
+        """
+        host:port of server
+        """
+        return '{}:{}'.format(*self.server_address[:2])
+
+    def ip(self, prefix: str) -> str:
+        """
+        Router address usable as --ip
+        :param prefix: prefix of router
+        """
+        return self.address + '/' + prefix
+
+    def inventory(self) -> str:
+        """
+        Inventory of all emulated routers (see rvcm.fleet.load_inventory)
+        """
+        return ''.join('{} {} {} emulator\n'.format(self.ip(prefix), self.user, self.password)
+                       for prefix in self.routers)
+
+    def handle_error(self, request, client_address):
+        # clients which gave up waiting (timeouts of load tests) are not errors of emulator
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def slot(self, prefix):
+        """
+        Context manager limiting concurrent requests to router
+        """
+        if not self.concurrency:
+            return contextlib.suppress()
+        with self._lock:
+            if prefix not in self._slots:
+                self._slots[prefix] = threading.BoundedSemaphore(self.concurrency)
+            return self._slots[prefix]
+
+    def delay(self):
+        with self._lock:
+            spent = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if spent > 0:
+            time.sleep(spent)
+
+    def failure(self):
+        """
+        Decide whether request fails
+        :return: HTTP status of failure (0 - drop connection) or None
+        """
+        if not self.failure_rate:
+            return None
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                return self.failure_status
+        return None
+
+
+@cli.command()
+@click.option('--listen', default='127.0.0.1:8680', help='Address of emulator (host:port)')
+@click.option('--routers', type=int, default=1, help='Number of emulated routers')
+@click.option('--rules', type=int, default=10, help='NAT rules of every router')
+@click.option('--calls', type=int, default=20, help='Calls log records of every router')
+@click.option('--latency', type=float, default=0.0, help='Delay of every response in seconds')
+@click.option('--jitter', type=float, default=0.0, help='Maximum random addition to latency in seconds')
+@click.option('--concurrency', type=int, default=0,
+              help='Requests processed by one router at the same time (0 - unlimited)')
+@click.option('--failure-rate', type=float, default=0.0, help='Fraction of requests which fail')
+@click.option('--failure-status', type=int, default=503, help='HTTP status of failed requests (0 - drop connection)')
+@click.option('--seed', type=int, default=1, help='Random seed of generated state, jitter and failures')
+@click.option('--write-inventory', default=None, help='Write inventory of emulated routers to the file')
+@click.option('--verbose', is_flag=True, help='Log requests')
+@click.pass_context
+def emulator(ctx, listen, routers, rules, calls, latency, jitter, concurrency, failure_rate, failure_status, seed,
+             write_inventory, verbose):
+    """
+    Emulate routers for load and latency testing (accepts --user and --password)
+    """
+    params = ctx.find_root().params
+    states = {'r{:04d}'.format(i): Router.synthetic(i, rules, calls, seed) for i in range(routers)}
+    server = Emulator(states, listen, params['user'], params['password'], latency=latency, jitter=jitter,
+                      concurrency=concurrency, failure_rate=failure_rate, failure_status=failure_status, seed=seed,
+                      verbose=verbose)
+    if write_inventory:
+        with open(write_inventory, 'w') as f:
+            f.write(server.inventory())
+    print("emulating {} router(s) on {} (first: --ip {})".format(routers, server.address, server.ip('r0000')),
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats), flush=True)
@@ -0,0 +1,257 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Prometheus / OpenMetrics exporter: routers are polled in background and /metrics is served from memory
+"""
+import time
+import threading
+from typing import List
+from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from rvcm.cli import *
+from rvcm.router import Info
+from rvcm.calls import History
+from rvcm.fleet import targets
+from rvcm.serve import TCPServer
+
+# Upper bounds of call duration histogram buckets in seconds
+DURATION_BUCKETS = (10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# name -> (type, help); samples of counters are exposed with _total suffix
+FAMILIES = [
+    ('rvcm_up', 'gauge', 'Last poll of the router succeeded'),
+    ('rvcm_last_poll_timestamp_seconds', 'gauge', 'Unix time of last successful poll'),
+    ('rvcm_poll_duration_seconds', 'gauge', 'Duration of last poll'),
+    ('rvcm_wan_line_up', 'gauge', 'WAN connection is up'),
+    ('rvcm_phone_line_up', 'gauge', 'Phone line is registered'),
+    ('rvcm_lan_line_up', 'gauge', 'LAN is connected'),
+    ('rvcm_apply_required', 'gauge', 'Router has saved but not applied changes'),
+    ('rvcm_calls', 'counter', 'Calls seen in router calls log'),
+    ('rvcm_call_duration_seconds', 'histogram', 'Duration of calls seen in router calls log'),
+]
+
+INFO_GAUGES = ('wan_line_up', 'phone_line_up', 'lan_line_up', 'apply_required')
+
+OPENMETRICS = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                          for k, v in labels.items()) + '}'
+
+
+class Collector:
+    """
+    Metrics of single router. Calls are counted once: only records newer than already seen are added
+    """
+
+    def __init__(self, context: Context, calls: bool = True):
+        """
+        :param context: connection to router
+        :param calls: poll calls log too
+        """
+        self.context = context
+        self.calls = calls
+        self.samples = {'rvcm_up': ['rvcm_up{} 0'.format(_labels(router=context.ip))]}
+        self._counts = {}  # (status, direction) -> [count, sum, bucket counts...]
+        self._mark = None  # stamp of newest seen call
+        self._seen = set()  # calls with stamp equal to mark
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """
+        Retrieve router state and update samples. Failure is reported by rvcm_up 0, other samples are kept
+        """
+        started = time.monotonic()
+        router = _labels(router=self.context.ip)
+        try:
+            info = Info().retrieve(self.context.getter)
+            if self.calls:
+                self._count(History().stream(self.context.getter))
+        except Exception:
+            with self._lock:
+                self.samples = dict(self.samples, rvcm_up=['rvcm_up{} 0'.format(router)])
+            raise
+        labels = _labels(router=self.context.ip, model=info.model, firmware=info.firmware,
+                         gpon_serial=info.gpon_serial)
+        samples = {
+            'rvcm_up': ['rvcm_up{} 1'.format(router)],
+            'rvcm_last_poll_timestamp_seconds': ['rvcm_last_poll_timestamp_seconds{} {:.3f}'.format(
+                router, time.time())],
+            'rvcm_poll_duration_seconds': ['rvcm_poll_duration_seconds{} {:.6f}'.format(
+                router, time.monotonic() - started)],
+        }
+        for field in INFO_GAUGES:
+            samples['rvcm_' + field] = ['rvcm_{}{} {}'.format(field, labels, int(bool(getattr(info, field))))]
+        calls, durations = [], []
+        for (status, direction), (count, total, *buckets) in sorted(self._counts.items()):
+            labels = dict(router=self.context.ip, status=status, direction=direction)
+            calls.append('rvcm_calls_total{} {}'.format(_labels(**labels), count))
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                durations.append('rvcm_call_duration_seconds_bucket{} {}'.format(
+                    _labels(**labels, le='{:.1f}'.format(bound)), bucket))
+            durations.append('rvcm_call_duration_seconds_bucket{} {}'.format(_labels(**labels, le='+Inf'), count))
+            durations.append('rvcm_call_duration_seconds_sum{} {}'.format(_labels(**labels), total))
+            durations.append('rvcm_call_duration_seconds_count{} {}'.format(_labels(**labels), count))
+        samples['rvcm_calls'] = calls
+        samples['rvcm_call_duration_seconds'] = durations
+        with self._lock:
+            self.samples = samples
+
+    def _count(self, calls):
+        # counts are replaced only when whole log is read, so interrupted poll does not count calls twice
+        mark, seen = self._mark, self._seen
+        newest, at_newest = mark, set(seen)
+        totals = {key: list(value) for key, value in self._counts.items()}
+        for call in calls:
+            key = call.to_tuple()
+            if mark is not None and (call.stamp < mark or (call.stamp == mark and key in seen)):
+                continue
+            if newest is None or call.stamp > newest:
+                newest, at_newest = call.stamp, set()
+            if call.stamp == newest:
+                at_newest.add(key)
+            counts = totals.setdefault((call.status, call.direction), [0, 0] + [0] * len(DURATION_BUCKETS))
+            counts[0] += 1
+            counts[1] += call.duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if call.duration <= bound:
+                    counts[2 + i] += 1
+        self._counts, self._mark, self._seen = totals, newest, at_newest
+
+
+class Exporter:
+    """
+    Polls collectors every interval in a thread pool; poll of a router is skipped while previous one runs
+    """
+
+    def __init__(self, collectors: List[Collector], interval: float = 15.0, parallel: int = 16):
+        self.collectors = collectors
+        self.interval = interval
+        self.errors = 0
+        self._pool = ThreadPoolExecutor(max_workers=max(1, parallel))
+        self._running = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='exporter', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            for collector in self.collectors:
+                future = self._running.get(id(collector))
+                if future is None or future.done():
+                    self._running[id(collector)] = self._pool.submit(self._poll, collector)
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _poll(self, collector):
+        try:
+            collector.poll()
+        except Exception:
+            self.errors += 1
+
+    def render(self, openmetrics: bool = False) -> str:
+        """
+        Text of metrics from last polls
+        :param openmetrics: OpenMetrics format instead of Prometheus text format 0.0.4
+        """
+        snapshots = []
+        for collector in self.collectors:
+            with collector._lock:
+                snapshots.append(collector.samples)
+        lines = []
+        for name, kind, description in FAMILIES:
+            samples = [line for samples in snapshots for line in samples.get(name, ())]
+            if not samples:
+                continue
+            family = name if openmetrics or kind != 'counter' else name + '_total'
+            lines.append('# HELP {} {}'.format(family, description))
+            lines.append('# TYPE {} {}'.format(family, kind))
+            lines.extend(samples)
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+        for collector in self.collectors:
+            collector.context.close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    GET /metrics - metrics of all routers (OpenMetrics if requested by Accept header)
+    """
+    server_version = 'rvcm'
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately: do not wait for delayed ACK of client between them
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            content, kind, code = b'not found\n', 'text/plain; charset=utf-8', 404
+        else:
+            openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+            content = self.server.exporter.render(openmetrics).encode('utf-8')
+            kind, code = OPENMETRICS if openmetrics else PROMETHEUS, 200
+        self.send_response(code)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+@cli.command()
+@click.option('--listen', default='127.0.0.1:9688', help='Address of metrics endpoint (host:port)')
+@click.option('--interval', type=float, default=15.0, help='Seconds between polls of every router')
+@click.option('--calls/--no-calls', default=True, help='Poll calls log for call counters and durations')
+@click.option('--verbose', is_flag=True, help='Log requests')
+@click.pass_context
+def exporter(ctx, listen, interval, calls, verbose):
+    """
+    Serve router (or whole inventory) metrics for Prometheus
+    """
+    params = ctx.find_root().params
+    factory = context_factory(params)
+    collectors = [Collector(factory(target), calls) for target in targets(params)]
+    service = Exporter(collectors, interval, params['parallel']).start()
+    host, _, port = listen.rpartition(':')
+    server = TCPServer((host or '127.0.0.1', int(port)), Handler)
+    server.exporter = service
+    server.verbose = verbose
+    print("exporting {} router(s) on http://{}/metrics".format(len(collectors), listen), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
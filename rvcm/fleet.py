@@ -0,0 +1,201 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import sys
+import json
+import time
+import threading
+from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import click
+
+
+class Target:
+    """
+    Single router from inventory
+    """
+
+    def __init__(self, ip: str, user: str = 'admin', password: str = 'admin', tags: List[str] = None):
+        self.ip = ip
+        self.user = user
+        self.password = password
+        self.tags = tags or []
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + ", ".join(
+            k + "=" + repr(v) for k, v in self.__dict__.items() if k != 'password') + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+def load_inventory(path: str, user: str = 'admin', password: str = 'admin') -> List[Target]:
+    """
+    Load routers inventory. JSON files (*.json) must contain list of objects with `ip`, `user`, `password`
+    and `tags` keys. Any other file is a text with one router per line: `IP [USER [PASSWORD [TAG,TAG...]]]`.
+    Empty lines and lines started by # are ignored, `-` in user or password means default value.
+    Results are keyed by router IP, so every router must be listed once
+    :param path: path to inventory file or - for stdin
+    :param user: default login name
+    :param password: default password
+    :return: list of targets
+    :raise click.ClickException: if router is listed twice
+    """
+    with click.open_file(path, 'r') as f:
+        content = f.read()
+    targets = []
+    if path.endswith('.json'):
+        for item in json.loads(content):
+            targets.append(Target(ip=item['ip'],
+                                  user=item.get('user') or user,
+                                  password=item.get('password') or password,
+                                  tags=list(item.get('tags') or [])))
+        return _unique(targets)
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        cols = line.split()
+        cols += ['-'] * (3 - len(cols))
+        targets.append(Target(ip=cols[0],
+                              user=user if cols[1] == '-' else cols[1],
+                              password=password if cols[2] == '-' else cols[2],
+                              tags=[tag for col in cols[3:] for tag in col.split(',') if tag]))
+    return _unique(targets)
+
+
+def _unique(targets: List[Target]) -> List[Target]:
+    seen = set()
+    for target in targets:
+        if target.ip in seen:
+            raise click.ClickException("router {} is listed in inventory more than once".format(target.ip))
+        seen.add(target.ip)
+    return targets
+
+
+def targets(params: dict) -> List[Target]:
+    """
+    Routers selected by options of root command: inventory filtered by tags or the single --ip router
+    :param params: parameters of root command
+    """
+    if params.get('inventory') is None:
+        return [Target(params['ip'], params['user'], params['password'])]
+    found = load_inventory(params['inventory'], params['user'], params['password'])
+    if params.get('tag'):
+        found = [target for target in found if set(target.tags) & set(params['tag'])]
+    return found
+
+
+class _Output:
+    """
+    Stdout replacement which routes writes of worker threads to their own buffers
+    """
+    # binary output (msgpack) can't be routed to text buffers of workers
+    buffer = None
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, data):
+        return (getattr(self.local, 'buffer', None) or self.stream).write(data)
+
+    def flush(self):
+        (getattr(self.local, 'buffer', None) or self.stream).flush()
+
+    def __getattr__(self, item):
+        return getattr(self.stream, item)
+
+
+class Fleet:
+    """
+    Runs the same subcommand against many routers by bounded pool of workers
+    """
+
+    def __init__(self, targets: List[Target], context_factory: callable, parallel: int = 16):
+        """
+        :param targets: routers to process
+        :param context_factory: function that makes Context by Target
+        :param parallel: maximum number of routers processed at the same time
+        """
+        self.targets = targets
+        self.context_factory = context_factory
+        self.parallel = max(1, parallel)
+
+    def execute(self, group: click.Group, parent: click.Context, args: List[str], target: Target):
+        """
+        Invoke subcommand for single router and capture its output
+        :return: result record
+        """
+        started = time.monotonic()
+        buffer = io.StringIO()
+        result = {"router": target.ip, "ok": True, "error": None}
+        output = sys.stdout
+        if isinstance(output, _Output):
+            output.local.buffer = buffer
+        try:
+            with self.context_factory(target) as router:
+                name, cmd, rest = group.resolve_command(parent, list(args))
+                with cmd.make_context(name, rest, parent=parent, obj=router) as ctx:
+                    cmd.invoke(ctx)
+        except click.exceptions.Exit as ex:
+            if ex.exit_code:
+                result.update(ok=False, error="exit code {}".format(ex.exit_code))
+        except Exception as ex:
+            result.update(ok=False, error="{}: {}".format(ex.__class__.__name__, ex))
+        finally:
+            if isinstance(output, _Output):
+                output.local.buffer = None
+        text = buffer.getvalue()
+        try:
+            result["output"] = json.loads(text)
+        except ValueError:
+            result["output"] = text
+        result["elapsed"] = round(time.monotonic() - started, 3)
+        return result
+
+    def run(self, group: click.Group, parent: click.Context, args: List[str], ndjson: bool = False):
+        """
+        Run subcommand for all targets and print merged output: one JSON object keyed by router IP or
+        (if ndjson) one JSON line per router as soon as it's done
+        :return: True if command succeeded for all routers
+        """
+        stdout = sys.stdout
+        sys.stdout = _Output(stdout)
+        results = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+                futures = [pool.submit(self.execute, group, parent, args, target) for target in self.targets]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result['router']] = result
+                    if ndjson:
+                        stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+                        stdout.flush()
+        finally:
+            sys.stdout = stdout
+        if not ndjson:
+            merged = {}
+            for target in self.targets:
+                merged[target.ip] = {k: v for k, v in results[target.ip].items() if k != 'router'}
+            print(json.dumps(merged, ensure_ascii=False, indent=4))
+        return all(result['ok'] for result in results.values())
@@ -0,0 +1,169 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Shared serialisation of records (rvcm.records.Record or plain dictionaries): writers of export formats
+(records are written one by one as they arrive) and reader of them. `msgpack` is compact binary form:
+array of keys followed by array of values for every record (install `rvcm[msgpack]`)
+"""
+import io
+import sys
+import csv
+import json
+from typing import Iterable, Iterator
+
+import click
+
+from rvcm.records import Record
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+FORMATS = ('json', 'ndjson', 'csv', 'msgpack')
+
+format_option = click.option('--format', 'fmt', type=click.Choice(FORMATS), default='json',
+                             help='Output format: indented JSON, JSON line per record, CSV with header or MessagePack')
+
+
+def _plain(record) -> dict:
+    # records are converted by generated to_dict, dictionaries are taken as is
+    return record if isinstance(record, dict) else record.to_dict()
+
+
+def _rows(records):
+    # (keys, iterator of value tuples) of non-empty records or (None, empty iterator)
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return None, iter(())
+    if isinstance(first, Record):
+        return list(first.keys()), (record.to_tuple() for record in _chain(first, records))
+    return list(_plain(first)), (tuple(_plain(record).values()) for record in _chain(first, records))
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def _binary(out):
+    if msgpack is None:
+        raise click.ClickException("msgpack is required for this format: pip install rvcm[msgpack]")
+    binary = getattr(out, 'buffer', out)
+    if binary is None or isinstance(binary, io.TextIOBase):
+        raise click.ClickException("msgpack output needs binary stream (it is not available in fleet mode)")
+    return binary
+
+
+def write_records(records: Iterable, fmt: str = 'json', out=None):
+    """
+    Write records in the format. JSON is the same as json.dumps([record.to_dict()...], indent=4) but written
+    record by record
+    :param records: records or flat dictionaries with the same keys
+    :param fmt: one of FORMATS
+    :param out: text stream (stdout by default; msgpack is written to its binary buffer)
+    :return: number of written records
+    """
+    out = out or sys.stdout
+    count = 0
+    if fmt == 'json':
+        for record in records:
+            item = "    " + json.dumps(_plain(record), ensure_ascii=False, indent=4).replace("\n", "\n    ")
+            out.write(("[\n" if not count else ",\n") + item)
+            out.flush()
+            count += 1
+        out.write("\n]\n" if count else "[]\n")
+    elif fmt == 'ndjson':
+        for record in records:
+            out.write(json.dumps(_plain(record), ensure_ascii=False) + "\n")
+            out.flush()
+            count += 1
+    elif fmt == 'csv':
+        keys, rows = _rows(records)
+        writer = csv.writer(out, lineterminator='\n')
+        for row in rows:
+            if not count:
+                writer.writerow(keys)
+            writer.writerow(row)
+            out.flush()
+            count += 1
+    elif fmt == 'msgpack':
+        binary = _binary(out)
+        out.flush()
+        packer = msgpack.Packer(datetime=False)
+        keys, rows = _rows(records)
+        for row in rows:
+            if not count:
+                binary.write(packer.pack(keys))
+            binary.write(packer.pack(row))
+            count += 1
+        binary.flush()
+        return count
+    else:
+        raise ValueError("unknown format: " + repr(fmt))
+    out.flush()
+    return count
+
+
+def write_record(record, fmt: str = 'json', out=None):
+    """
+    Write single record (indented JSON object, one JSON line, CSV with header or MessagePack)
+    """
+    out = out or sys.stdout
+    if fmt == 'json':
+        out.write(json.dumps(_plain(record), ensure_ascii=False, indent=4) + "\n")
+        out.flush()
+    else:
+        write_records([record], fmt, out)
+
+
+def read_records(stream, fmt: str = 'json', cls=None) -> Iterator:
+    """
+    Read records written by write_records
+    :param stream: text stream (binary for msgpack)
+    :param fmt: one of FORMATS
+    :param cls: record class to make records by from_dict / from_tuple (None - plain dictionaries)
+    :return: iterator of records
+    """
+    if fmt == 'json':
+        items = json.load(stream)
+        # single record of write_record
+        items = [items] if isinstance(items, dict) else items
+        yield from (cls.from_dict(item) if cls else item for item in items)
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                item = json.loads(line)
+                yield cls.from_dict(item) if cls else item
+    elif fmt == 'csv':
+        # values of CSV are strings: typed fields of records decode them (see rvcm.records.int_field)
+        for item in csv.DictReader(stream):
+            yield cls.from_dict(item) if cls else item
+    elif fmt == 'msgpack':
+        if msgpack is None:
+            raise click.ClickException("msgpack is required for this format: pip install rvcm[msgpack]")
+        unpacker = msgpack.Unpacker(stream, use_list=False, raw=False)
+        keys = next(unpacker, None)
+        for row in unpacker:
+            yield cls.from_tuple(row) if cls and tuple(keys) == cls.keys() else (
+                cls.from_dict(dict(zip(keys, row))) if cls else dict(zip(keys, row)))
+    else:
+        raise ValueError("unknown format: " + repr(fmt))
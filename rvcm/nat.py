@@ -18,9 +18,16 @@ WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEM
 COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
+import time
 from enum import Enum
 from typing import List
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from rvcm.cli import *
+from rvcm import trace
+from rvcm.records import Record, enum_field, int_field, bool_field
+from rvcm.formats import format_option, write_records
+from rvcm.pending import apply_option, apply_after
 
 
 class ForwardType(Enum):
@@ -35,10 +42,16 @@ class ForwardType(Enum):
         return self.name
 
 
-class Forward:
+class Forward(Record):
     """
     Describes port forwarding single rule in the router
     """
+    __slots__ = ('dest_ip_sec', 'src_min_port', 'src_max_port', 'dest_min_port', 'dest_max_port', 'name', 'enabled',
+                 'type')
+    FIELDS = (int_field('dest_ip_sec'), int_field('src_min_port'), int_field('src_max_port'),
+              int_field('dest_min_port'), int_field('dest_max_port'), 'name', bool_field('enabled'),
+              enum_field('type', ForwardType))
+    LABEL = 'forwarding rule'
 
     def __init__(self, name='', dest_ip_sec='', src_min_port=0, src_max_port=0, dest_min_port=0, dest_max_port=0,
                  enabled=False,
@@ -52,8 +65,18 @@ class Forward:
         self.enabled = enabled
         self.type = type
 
-    def __repr__(self):
-        return self.__class__.__name__ + "(" + ", ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
+    def validate(self):
+        """
+        Check that rule can be stored in the router
+        :raise ValueError: with description of first problem
+        """
+        if not self.name or '-' in self.name or ';' in self.name:
+            raise ValueError("rule name must be non-empty and without '-' and ';': " + repr(self.name))
+        if not 0 < int(self.dest_ip_sec) < 255:
+            raise ValueError("IP last section must be in 1..254: " + repr(self.dest_ip_sec))
+        for low, high in ((self.src_min_port, self.src_max_port), (self.dest_min_port, self.dest_max_port)):
+            if not 0 < int(low) <= int(high) <= 65535:
+                raise ValueError("invalid port range {}-{} in rule {}".format(low, high, self.name))
 
     def __str__(self):
         return "%s-%s-%s-%s-%s-%s-%s-%s-0-" % (
@@ -68,39 +91,316 @@ class Forward:
         )
 
 
+class RuleIndex:
+    """
+    Index of forwarding rules: rules by name and external port ranges per protocol (rules with
+    ForwardType.BOTH are placed into TCP and UDP). For each protocol it keeps rules sorted by first port
+    and merged disjoint busy ranges, so free range search takes O(log n) per step and overlap check takes
+    O(log n + k), where k is number of rules in busy ranges overlapping the checked one.
+    """
+    PROTOCOLS = (ForwardType.TCP, ForwardType.UDP)
+
+    def __init__(self, forwards: List[Forward] = ()):
+        self.names = {}
+        self._starts = {proto: [] for proto in self.PROTOCOLS}
+        self._rules = {proto: [] for proto in self.PROTOCOLS}
+        self._busy = {}
+        self._cursors = {}
+        for forward in forwards:
+            self.add(forward)
+
+    @classmethod
+    def protocols(cls, type: ForwardType):
+        """
+        Protocols used by rule type
+        """
+        return cls.PROTOCOLS if type == ForwardType.BOTH else (type,)
+
+    def add(self, forward: Forward):
+        """
+        Put rule into index
+        """
+        self.names.setdefault(forward.name, []).append(forward)
+        low, high = int(forward.src_min_port), int(forward.src_max_port)
+        for proto in self.protocols(forward.type):
+            pos = bisect_right(self._starts[proto], low)
+            self._starts[proto].insert(pos, low)
+            self._rules[proto].insert(pos, forward)
+            if proto in self._busy:
+                self._occupy(proto, low, high)
+
+    def remove(self, forward: Forward):
+        """
+        Remove rule from index. Must be called before the rule fields are changed
+        """
+        same = self.names.get(forward.name, [])
+        same[:] = [frw for frw in same if frw is not forward]
+        if not same:
+            self.names.pop(forward.name, None)
+        low = int(forward.src_min_port)
+        for proto in self.protocols(forward.type):
+            starts, rules = self._starts[proto], self._rules[proto]
+            for pos in range(bisect_left(starts, low), bisect_right(starts, low)):
+                if rules[pos] is forward:
+                    del starts[pos]
+                    del rules[pos]
+                    break
+        # merged ranges can't be split cheaply: rebuild them on demand
+        self._busy.clear()
+        self._cursors.clear()
+
+    def reserve(self, low: int, high: int, type: ForwardType):
+        """
+        Mark ports as busy without rule (until any rule is removed or the index is rebuilt)
+        """
+        for proto in self.protocols(type):
+            self._occupy(proto, low, high)
+
+    def conflicts(self, forward: Forward) -> List[Forward]:
+        """
+        Find rules which external port range overlaps the rule range for the same protocol
+        :return: list of conflicting rules (except the rule itself)
+        """
+        low, high = int(forward.src_min_port), int(forward.src_max_port)
+        found = []
+        for proto in self.protocols(forward.type):
+            # overlapping rules lie in busy ranges overlapping low..high: scan from the first of them
+            busy_starts, busy_ends = self._merged(proto)
+            first = bisect_left(busy_ends, low)
+            if first == len(busy_ends) or busy_starts[first] > high:
+                continue
+            starts, rules = self._starts[proto], self._rules[proto]
+            for pos in range(bisect_left(starts, busy_starts[first]), bisect_right(starts, high)):
+                frw = rules[pos]
+                if int(frw.src_max_port) >= low and frw is not forward and frw not in found:
+                    found.append(frw)
+        return found
+
+    def free(self, size: int, type: ForwardType = ForwardType.BOTH, low: int = 1, high: int = 65535):
+        """
+        Find lowest range of free external ports
+        :param size: number of ports
+        :param type: protocol of future rule
+        :param low: minimal allowed port
+        :param high: maximal allowed port
+        :return: (first port, last port) or None if there is no such range
+        """
+        # adding rules only shrinks free ranges, so the search continues from where the previous one stopped
+        key = (type, size, low)
+        start = max(low, self._cursors.get(key, low))
+        while start + size - 1 <= high:
+            ends = [self._blocker(proto, start, start + size - 1) for proto in self.protocols(type)]
+            ends = [end for end in ends if end is not None]
+            if not ends:
+                self._cursors[key] = start
+                return start, start + size - 1
+            start = max(ends) + 1
+        self._cursors[key] = start
+        return None
+
+    def _blocker(self, proto: ForwardType, low: int, high: int):
+        # last port of busy range that overlaps low..high or None
+        starts, ends = self._merged(proto)
+        pos = bisect_right(starts, high) - 1
+        if pos >= 0 and ends[pos] >= low:
+            return ends[pos]
+        return None
+
+    def _merged(self, proto: ForwardType):
+        if proto not in self._busy:
+            self._busy[proto] = ([], [])
+            for frw in self._rules[proto]:
+                self._occupy(proto, int(frw.src_min_port), int(frw.src_max_port))
+        return self._busy[proto]
+
+    def _occupy(self, proto: ForwardType, low: int, high: int):
+        starts, ends = self._merged(proto)
+        first = bisect_left(ends, low - 1)
+        last = bisect_right(starts, high + 1)
+        if first < last:
+            low = min(low, starts[first])
+            high = max(high, ends[last - 1])
+        starts[first:last] = [low]
+        ends[first:last] = [high]
+
+
+class Plan:
+    """
+    Changes required to turn one forwarding table to another, keyed by rule name
+    """
+
+    def __init__(self, added: List[Forward] = None, removed: List[Forward] = None, changed: list = None,
+                 reordered=False):
+        """
+        :param added: rules which exist only in target table
+        :param removed: rules which exist only in source table
+        :param changed: pairs (old, new) of rules with the same name and different fields
+        :param reordered: True if rules are the same but order differs
+        """
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+        self.reordered = reordered
+
+    def pretty(self):
+        """
+        Make human-readable list of changes
+        :return: text
+        """
+        lines = []
+        lines += ["+ {}".format(frw) for frw in self.added]
+        lines += ["- {}".format(frw) for frw in self.removed]
+        for old, new in self.changed:
+            fields = ", ".join("{}: {} -> {}".format(key, old.to_dict()[key], value)
+                               for key, value in new.to_dict().items() if old.to_dict()[key] != value)
+            lines += ["~ {} ({})".format(old.name, fields)]
+        if self.reordered:
+            lines += ["~ order of rules"]
+        return "\n".join(lines) if lines else "no changes"
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or self.reordered)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+class SaveMismatch(RouterError):
+    """
+    Router stored forwarding table which differs from the saved one (or did not show table after save)
+    """
+
+    def __init__(self, ip: str, url: str, sent: str, stored: str = None):
+        """
+        :param sent: saved table (as NAT.vs_list)
+        :param stored: table shown by router after save (None if response has no table)
+        """
+        if stored is None:
+            message = "response of save has no forwarding table"
+        else:
+            sent_rules = [rule for rule in sent.split(';') if rule]
+            stored_rules = [rule for rule in stored.split(';') if rule]
+            pos = next((i for i, (a, b) in enumerate(zip(sent_rules, stored_rules)) if a != b),
+                       min(len(sent_rules), len(stored_rules)))
+            message = "stored {} rules instead of {}, first difference at #{}: sent {!r}, stored {!r}".format(
+                len(stored_rules), len(sent_rules), pos + 1, (sent_rules[pos:] or [None])[0],
+                (stored_rules[pos:] or [None])[0])
+        super().__init__(ip, url, message)
+        self.sent = sent
+        self.stored = stored
+
+
+class NATConflict(RouterError):
+    """
+    Forwarding table was changed by somebody else and own changes can not be replayed on it
+    """
+
+
+def fingerprint(vs_list: str) -> str:
+    """
+    Version of forwarding table: hash of rules as the router keeps them (raw vs_list line of NAT page)
+    """
+    import hashlib
+    return hashlib.sha1(vs_list.encode('utf-8')).hexdigest()[:16]
+
+
+def _address(resp):
+    # (router, url) of response for errors
+    from urllib.parse import urlsplit
+    address = urlsplit(getattr(resp, 'url', '') or '')
+    return address.netloc, address.path + ('?' + address.query if address.query else '')
+
+
 class NAT:
     """
-    Describes table of port forwarding rules in the router
+    Describes table of port forwarding rules in the router.
+
+    Retrieved table has `version` (fingerprint of rules as parsed) and log of changes made by NAT methods
+    (`edits`, operations as in execute). Save with requester checks the live table first: if its version differs,
+    the edits are replayed on the live table (rebase) and the result is saved; then it reads the table again and
+    saves the edits once more if another writer overwrote them, so concurrent writers of different rules do not
+    overwrite each other
     """
     URL = '/vs.htm?l0=1&l1=2&l2=0&l3=-1'
     UPDATE = '/setup.cgi?l0=1&l1=2&l2=0&l3=-1'
+    # saves of checked table (see save) before giving up on writers overwriting it
+    SAVE_ATTEMPTS = 3
+    # delay of check after save in durations of read and save (see save)
+    SETTLE_FACTOR = 2
 
     def __init__(self, forwards: List[Forward] = None):
+        # fingerprint of table retrieved from router (None - not retrieved)
+        self.version = None
+        # operations made after retrieve
+        self.edits = []
         self.forwards = forwards or []
 
+    @property
+    def forwards(self) -> List[Forward]:
+        """
+        Rules of the table. Index is rebuilt when the list is replaced or its length changed; after changing
+        fields of rules in place (not by NAT methods) call reindex()
+        """
+        return self._forwards
+
+    @forwards.setter
+    def forwards(self, value: List[Forward]):
+        self._forwards = value
+        self._index = None
+        if self.version is not None:
+            # whole table is replaced: earlier edits do not matter for rebase
+            self.edits = [{'op': 'replace', 'forwards': [frw.to_dict() for frw in value]}]
+
+    @property
+    def index(self) -> RuleIndex:
+        """
+        Index of rules by name and port ranges
+        """
+        if self._index is None or self._indexed != len(self._forwards):
+            self.reindex()
+        return self._index
+
+    def reindex(self):
+        """
+        Rebuild index of rules
+        """
+        self._index = RuleIndex(self._forwards)
+        self._indexed = len(self._forwards)
+
     def parse(self, data):
         """
         Parse content of NAT page and gather info into self structure
         :param data: Content of NAT page info
         """
-        fws = []
-        for line in data.splitlines():
-            if line.startswith('var vs_list'):
-                fws = line[15:-3].split(';')
-                break
-        self.forwards.clear()
-        for rule in fws:
-            opt = rule.split('-')
-            forward = Forward()
-            forward.enabled = int(opt[0]) != 0
-            forward.name = opt[1]
-            forward.src_min_port = int(opt[2])
-            forward.src_max_port = int(opt[3])
-            forward.type = ForwardType(int(opt[4]))
-            forward.dest_min_port = int(opt[5])
-            forward.dest_max_port = int(opt[6])
-            forward.dest_ip_sec = int(opt[7])
-            self.forwards.append(forward)
+        with trace.span('parse.nat') as fields:
+            raw = ''
+            for line in data.splitlines():
+                if line.startswith('var vs_list'):
+                    raw = line
+                    break
+            fws = raw[15:-3].split(';')
+            self.forwards.clear()
+            self._index = None
+            for rule in fws:
+                if not rule:
+                    continue
+                opt = rule.split('-')
+                forward = Forward()
+                forward.enabled = int(opt[0]) != 0
+                forward.name = opt[1]
+                forward.src_min_port = int(opt[2])
+                forward.src_max_port = int(opt[3])
+                forward.type = ForwardType(int(opt[4]))
+                forward.dest_min_port = int(opt[5])
+                forward.dest_max_port = int(opt[6])
+                forward.dest_ip_sec = int(opt[7])
+                self.forwards.append(forward)
+            fields['rules'] = len(self.forwards)
+            self.version = fingerprint(raw)
+            self.edits = []
 
     def retrieve(self, requester: callable):
         """
@@ -112,16 +412,371 @@ class NAT:
         self.parse(resp.text)
         return self
 
-    def save(self, poster: callable):
+    async def retrieve_async(self, requester: callable):
+        """
+        Get information about NAT from router asynchronously
+        :param requester: coroutine function that returns page by url (see rvcm.aio.AsyncContext)
+        :return: self
+        """
+        resp = await requester(self.URL)
+        self.parse(resp.text)
+        return self
+
+    def save(self, poster: callable, requester: callable = None):
+        """
+        Save information about NAT in router. Router answers by NAT page (next_file), so the stored table is
+        read from the response and checked without another request
+        :param poster: function that post data to router by URL and returns response
+        :param requester: function that returns page by url (like Context.getter, called with fresh=True to skip
+        cache): if set, live table of retrieved NAT is checked before save and edits are rebased on it when
+        somebody changed it; after save (and a pause of SETTLE_FACTOR durations of the read and save) the live
+        table is read again and, if another writer overwrote the edits, they are rebased and saved once more (up
+        to SAVE_ATTEMPTS saves)
+        :return: self holding the table as stored by router (unchanged if poster returned nothing, like dry run)
+        :raise SaveMismatch: if router stored another table
+        :raise NATConflict: if edits can not be rebased on changed table or are still overwritten after all saves
+        """
+        if requester is None or self.version is None:
+            return self._saved(poster(self.UPDATE, self._form(), self.URL))
+        edits = self.edits
+        started = time.monotonic()
+        if not self.rebase(requester(self.URL, fresh=True)):
+            return self
+        for _ in range(self.SAVE_ATTEMPTS):
+            expected = self._touched(edits)
+            resp = poster(self.UPDATE, self._form(), self.URL)
+            self._saved(resp)
+            if resp is None:
+                return self
+            time.sleep(self._settle(started))
+            started = time.monotonic()
+            live = requester(self.URL, fresh=True)
+            if self._kept(live, edits, expected):
+                return self
+        raise self._overwritten(live)
+
+    async def save_async(self, poster: callable, requester: callable = None):
+        """
+        Save information about NAT in router asynchronously (see save)
+        :param poster: coroutine function that post data to router by URL (see rvcm.aio.AsyncContext)
+        :param requester: coroutine function that returns page by url and accepts fresh flag (check of live table
+        before and after save)
+        :return: self holding the table as stored by router
+        :raise SaveMismatch: if router stored another table
+        :raise NATConflict: if edits can not be rebased on changed table or are still overwritten after all saves
+        """
+        import asyncio
+        if requester is None or self.version is None:
+            return self._saved(await poster(self.UPDATE, self._form(), self.URL))
+        edits = self.edits
+        started = time.monotonic()
+        if not self.rebase(await requester(self.URL, fresh=True)):
+            return self
+        for _ in range(self.SAVE_ATTEMPTS):
+            expected = self._touched(edits)
+            resp = await poster(self.UPDATE, self._form(), self.URL)
+            self._saved(resp)
+            if resp is None:
+                return self
+            await asyncio.sleep(self._settle(started))
+            started = time.monotonic()
+            live = await requester(self.URL, fresh=True)
+            if self._kept(live, edits, expected):
+                return self
+        raise self._overwritten(live)
+
+    def _form(self):
+        from collections import OrderedDict
+        with trace.span('save.nat', rules=len(self.forwards)):
+            return OrderedDict(self.generate_form_fields())
+
+    def _saved(self, resp):
+        stored = self.verify(resp)
+        if resp is not None:
+            # stored table is the new base: take its rules, so this object matches the router after save
+            self._forwards = stored.forwards
+            self._index = None
+            self.version = stored.version
+            self.edits = []
+        return self
+
+    def _settle(self, started: float) -> float:
+        # writer which read the table before our save may store its (stale) table later: wait until it is done,
+        # assuming it is not much slower than our read and save, before checking that the edits survived
+        return self.SETTLE_FACTOR * (time.monotonic() - started)
+
+    def _touched(self, edits: List[dict]):
+        # state of rules named by edits (whole table if it was replaced): equal before and after save if nobody
+        # overwrote the edits. Edits can not be replayed to check it - create would add the rule once more
+        names = set()
+        for operation in edits:
+            if operation['op'] == 'replace':
+                return self.vs_list()
+            names.update((operation.get('name'), operation.get('new_name')))
+        names.discard(None)
+        return {name: sorted(str(frw) for frw in self.forwards if frw.name == name) for name in names}
+
+    def _kept(self, resp, edits: List[dict], expected) -> bool:
+        # check live table read after save: take it if the edits are there, otherwise rebase them on it
+        live = NAT()
+        live.parse(resp.text)
+        if live._touched(edits) != expected:
+            trace.count('overwrites')
+            self.edits = edits
+            if self.rebase(resp):
+                return False
+        self._forwards = live.forwards
+        self._index = None
+        self.version = live.version
+        self.edits = []
+        return True
+
+    def _overwritten(self, resp) -> NATConflict:
+        ip, url = _address(resp)
+        return NATConflict(ip, url, "changes were overwritten by other writers after each of {} saves".format(
+            self.SAVE_ATTEMPTS))
+
+    def rebase(self, resp) -> bool:
         """
-        Save information about NAT in router
+        Compare version of this table with live one and replay edits on the live table if it was changed
+        :param resp: response with live NAT page
+        :return: False if there is nothing to save (edits are already in the live table)
+        :raise NATConflict: if some edit is not valid for the live table
+        """
+        live = NAT()
+        live.parse(resp.text)
+        if live.version == self.version:
+            return True
+        trace.count('rebases')
+        edits, self.edits = self.edits, []
+        self.version = live.version
+        self._forwards = live.forwards
+        self._index = None
+        base = live.vs_list()
+        # replayed operations are logged again, so the table can be rebased once more
+        for num, operation in enumerate(edits, 1):
+            try:
+                if operation['op'] == 'replace':
+                    self.forwards = [Forward.from_dict(item) for item in operation['forwards']]
+                else:
+                    self.execute(operation)
+            except (ValueError, KeyError) as ex:
+                ip, url = _address(resp)
+                raise NATConflict(ip, url, "table was changed, edit #{} ({}) can not be applied: {}".format(
+                    num, operation['op'], ex)) from ex
+        return self.vs_list() != base
+
+    def verify(self, resp):
+        """
+        Check that response of save shows this table
+        :param resp: response of save (NAT page)
+        :return: table parsed from response (self if there is no response)
+        :raise SaveMismatch: if router shows another table or no table at all
+        """
+        if resp is None:
+            return self
+        ip, url = _address(resp)
+        if 'var vs_list' not in resp.text:
+            raise SaveMismatch(ip, url, self.vs_list())
+        stored = NAT()
+        stored.parse(resp.text)
+        if stored.vs_list() != self.vs_list():
+            raise SaveMismatch(ip, url, self.vs_list(), stored.vs_list())
+        return stored
+
+    @classmethod
+    @contextmanager
+    def transaction(cls, requester: callable, poster: callable, guard: bool = False):
+        """
+        Retrieve table once, let caller change it in memory and save it once if anything changed.
+        Nothing is saved if the block raises an exception.
+
+            with NAT.transaction(ctx.getter, ctx.poster) as nat:
+                nat.create(Forward(...))
+                nat.remove('old')
+
+        It costs one read and (if anything changed) one save. With guard the live table is read once more before
+        save: changes made by others in the meantime are kept and changes of the block are replayed on top of
+        them (see rebase); and once more after save to replay the changes again if another writer overwrote
+        them (see save). After save the table holds rules as stored by router, so it can be served without
+        reading it again.
+
+        :param requester: function that returns page by url and accepts fresh flag (see save)
         :param poster: function that post data to router by URL
+        :param guard: check live table before and after save (two more reads)
+        """
+        nat = cls().retrieve(requester)
+        original = nat.vs_list()
+        yield nat
+        if nat.vs_list() != original:
+            nat.save(poster, requester if guard else None)
+
+    def diff(self, other) -> Plan:
+        """
+        Compare this table with another one (usually desired). Rule names must be unique in both tables
+        :param other: target table
+        :return: changes required to turn this table into other
         """
+        mine = self._by_name()
+        theirs = other._by_name()
+        plan = Plan()
+        plan.added = [frw for name, frw in theirs.items() if name not in mine]
+        plan.removed = [frw for name, frw in mine.items() if name not in theirs]
+        plan.changed = [(frw, theirs[name]) for name, frw in mine.items()
+                        if name in theirs and str(frw) != str(theirs[name])]
+        plan.reordered = not plan and self.vs_list() != other.vs_list()
+        return plan
+
+    def _by_name(self):
         from collections import OrderedDict
-        params = OrderedDict()
-        for key, value in self.generate_form_fields():
-            params[key] = value
-        poster(self.UPDATE, params, self.URL)
+        rules = OrderedDict()
+        for frw in self.forwards:
+            if frw.name in rules:
+                raise ValueError("duplicated rule name: " + frw.name)
+            rules[frw.name] = frw
+        return rules
+
+    def find(self, name: str) -> List[Forward]:
+        """
+        Find rules by name
+        :return: list of rules with the name
+        """
+        return list(self.index.names.get(name, []))
+
+    def create(self, forward: Forward, check=False) -> List[Forward]:
+        """
+        Add new rule
+        :param check: reject rule which external ports overlap other rules of the same protocol
+        :return: list with added rule
+        """
+        forward.validate()
+        if check:
+            conflicts = self.index.conflicts(forward)
+            if conflicts:
+                raise ValueError("ports {}-{} of rule {} overlap rules: {}".format(
+                    forward.src_min_port, forward.src_max_port, forward.name,
+                    ", ".join(frw.name for frw in conflicts)))
+        index = self.index
+        self._forwards.append(forward)
+        index.add(forward)
+        self._indexed += 1
+        self.edits.append(dict(forward.to_dict(), op='create', check=check))
+        return [forward]
+
+    def allocate(self, size: int, type: ForwardType = ForwardType.BOTH, low: int = 1024, high: int = 65535,
+                 reserve=False):
+        """
+        Find lowest range of external ports not used by any rule of the protocol
+        :param size: number of ports
+        :param type: protocol of future rule
+        :param low: minimal allowed port
+        :param high: maximal allowed port
+        :param reserve: mark found range as busy, so next allocate returns another one
+        :return: (first port, last port)
+        :raise ValueError: if there is no free range
+        """
+        found = self.index.free(size, type, low, high)
+        if found is None:
+            raise ValueError("no free range of {} {} ports in {}-{}".format(size, type.name, low, high))
+        if reserve:
+            self.index.reserve(found[0], found[1], type)
+        return found
+
+    def update(self, name: str, **fields) -> List[Forward]:
+        """
+        Change fields (attributes of Forward) of all rules with the name. None values are ignored
+        :return: list of changed rules
+        """
+        return self._change(name, fields, 'update')
+
+    def _change(self, name: str, fields: dict, op: str) -> List[Forward]:
+        fields = {key: value for key, value in fields.items() if value is not None}
+        if 'type' in fields and not isinstance(fields['type'], ForwardType):
+            fields['type'] = ForwardType[str(fields['type']).upper()]
+        changed = []
+        for frw in self.find(name):
+            updated = Forward.from_dict(dict(frw.to_dict(), **fields))
+            if updated.to_tuple() != frw.to_tuple():
+                updated.validate()
+                self.index.remove(frw)
+                for slot in Forward.__slots__:
+                    setattr(frw, slot, getattr(updated, slot))
+                self.index.add(frw)
+                changed.append(frw)
+        self.edits.append(self._operation(op, name, fields))
+        return changed
+
+    def remove(self, name: str) -> List[Forward]:
+        """
+        Remove all rules with the name
+        :return: list of removed rules
+        """
+        removed = self.find(name)
+        if removed:
+            index = self.index
+            for frw in removed:
+                index.remove(frw)
+            self._forwards = [frw for frw in self._forwards if frw.name != name]
+            self._indexed = len(self._forwards)
+        self.edits.append({'op': 'remove', 'name': name})
+        return removed
+
+    def enable(self, name: str) -> List[Forward]:
+        """
+        Enable all rules with the name
+        :return: list of changed rules
+        """
+        return self._change(name, {'enabled': True}, 'enable')
+
+    def disable(self, name: str) -> List[Forward]:
+        """
+        Disable (but not remove) all rules with the name
+        :return: list of changed rules
+        """
+        return self._change(name, {'enabled': False}, 'disable')
+
+    def rename(self, name: str, new_name: str) -> List[Forward]:
+        """
+        Rename all rules with the name
+        :return: list of renamed rules
+        """
+        return self._change(name, {'name': new_name}, 'rename')
+
+    OPERATIONS = ('create', 'update', 'remove', 'enable', 'disable', 'rename')
+
+    @staticmethod
+    def _operation(op: str, name: str, fields: dict) -> dict:
+        # operation for edits log (as accepted by execute)
+        if op == 'rename':
+            return {'op': op, 'name': name, 'new_name': fields['name']}
+        if op != 'update':
+            return {'op': op, 'name': name}
+        return dict({key: value.name if isinstance(value, ForwardType) else value for key, value in fields.items()},
+                    op=op, name=name)
+
+    def execute(self, operation: dict) -> List[Forward]:
+        """
+        Apply single operation described by dictionary. Key `op` is one of OPERATIONS, other keys are
+        arguments: `create` takes rule fields, `update` takes `name` and fields to change, `rename` takes
+        `name` and `new_name`, others take `name`.
+        :return: list of affected rules
+        """
+        args = dict(operation)
+        op = args.pop('op', None)
+        if op not in self.OPERATIONS:
+            raise ValueError("unknown operation: " + repr(op))
+        if op == 'create':
+            check = args.pop('check', False)
+            return self.create(Forward.from_dict(args), check=check)
+        if 'name' not in args:
+            raise ValueError("operation {} requires name".format(op))
+        return getattr(self, op)(**args)
+
+    def vs_list(self) -> str:
+        """
+        Serialize rules as the router keeps them (value of h_vs_list field)
+        """
+        return ";".join(str(f) for f in self.forwards) + ";"
 
     def generate_form_fields(self):
         """
@@ -142,7 +797,7 @@ class NAT:
             yield ('private_port_high_%s' % i, str(forward.dest_max_port))
             yield ('private_ip_%s' % i, str(forward.dest_ip_sec))
             yield ('if_%s' % i, '0')
-        yield ('h_vs_list', ";".join(str(f) for f in self.forwards) + ";")
+        yield ('h_vs_list', self.vs_list())
         yield ('fwi_des', '')
         yield ('todo', 'save')
         yield ('this_file', 'vs.htm')
@@ -150,12 +805,20 @@ class NAT:
         yield ('message', '')
 
     def __repr__(self):
-        return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
+        return self.__class__.__name__ + "(forwards=" + repr(self.forwards) + ")"
 
     def __str__(self):
         return repr(self)
 
 
+def guard_option(f):
+    """
+    Add --guard flag to command which saves forwarding table (see NAT.transaction)
+    """
+    return click.option('--guard', is_flag=True,
+                        help='Re-read table before and after save to keep changes of concurrent writers')(f)
+
+
 @cli.group()
 def nat():
     """
@@ -197,25 +860,36 @@ def info(ctx):
         print(line)
 
 
+@nat.command()
+@format_option
+@click.pass_context
+def export(ctx, fmt):
+    """
+    Export forwarding table (JSON is accepted by sync)
+    """
+    nat = NAT().retrieve(ctx.obj.getter)
+    write_records(nat.forwards, fmt)
+
+
 @nat.command()
 @click.argument('name')
-@click.argument('dest-ip-section')
-@click.argument('min-src-port')
-@click.argument('max-src-port')
-@click.argument('min-dst-port')
-@click.argument('max-dst-port')
+@click.argument('dest-ip-section', type=int)
+@click.argument('min-src-port', type=int)
+@click.argument('max-src-port', type=int)
+@click.argument('min-dst-port', type=int)
+@click.argument('max-dst-port', type=int)
 @click.option('--proto', default=ForwardType.BOTH.name,
               type=click.Choice([ForwardType.BOTH.name, ForwardType.TCP.name, ForwardType.UDP.name]),
               help='Protocol type to forward')
+@click.option('--check', is_flag=True, help='Reject rule if its source ports overlap other rules')
+@apply_option
+@guard_option
 @click.pass_context
-def create(ctx, name: str, dest_ip_section: str, min_src_port: int, max_src_port: int, min_dst_port: int, max_dst_port,
-
-           proto: ForwardType):
+def create(ctx, name: str, dest_ip_section: int, min_src_port: int, max_src_port: int, min_dst_port: int,
+           max_dst_port: int, proto: str, check: bool, apply_mode: str, guard: bool):
     """
     Create forwarding rule
     """
-    assert 0 < len(dest_ip_section) <= 3, "IP last section required"
-
     forward = Forward(name=name, dest_ip_sec=dest_ip_section)
     forward.src_min_port = min_src_port
     forward.src_max_port = max_src_port
@@ -223,9 +897,27 @@ def create(ctx, name: str, dest_ip_section: str, min_src_port: int, max_src_port
     forward.dest_max_port = max_dst_port
     forward.enabled = False
     forward.type = ForwardType[proto]
+    with apply_after(ctx, apply_mode) as poster, NAT.transaction(ctx.obj.getter, poster, guard) as nat:
+        _edit(nat.create, forward, check=check)
+
+
+@nat.command()
+@click.option('--size', type=int, default=1, help='Number of ports in range')
+@click.option('--proto', default=ForwardType.BOTH.name,
+              type=click.Choice([ForwardType.BOTH.name, ForwardType.TCP.name, ForwardType.UDP.name]),
+              help='Protocol type of future rule')
+@click.option('--min-port', type=int, default=1024, help='Minimal allowed port')
+@click.option('--max-port', type=int, default=65535, help='Maximal allowed port')
+@click.option('--count', type=int, default=1, help='Number of ranges to allocate')
+@click.pass_context
+def allocate(ctx, size: int, proto: str, min_port: int, max_port: int, count: int):
+    """
+    Print lowest free range(s) of source ports
+    """
     nat = NAT().retrieve(ctx.obj.getter)
-    nat.forwards.append(forward)
-    nat.save(ctx.obj.poster)
+    for _ in range(count):
+        low, high = _edit(nat.allocate, size, ForwardType[proto], min_port, max_port, reserve=True)
+        print("{} {}".format(low, high))
 
 
 @nat.command()
@@ -235,119 +927,168 @@ def create(ctx, name: str, dest_ip_section: str, min_src_port: int, max_src_port
 @click.option('--max-src-port', type=int)
 @click.option('--min-dst-port', type=int)
 @click.option('--max-dst-port', type=int)
-@click.option('--proto', default=ForwardType.BOTH.name,
+@click.option('--proto', default=None,
               type=click.Choice([ForwardType.BOTH.name, ForwardType.TCP.name, ForwardType.UDP.name]),
               help='Protocol type to forward')
+@apply_option
+@guard_option
 @click.pass_context
-def update(ctx, name: str, dest_ip_section: str, min_src_port: int, max_src_port: int, min_dst_port: int, max_dst_port,
-           proto: ForwardType):
+def update(ctx, name: str, dest_ip_section: int, min_src_port: int, max_src_port: int, min_dst_port: int,
+           max_dst_port: int, proto: str, apply_mode: str, guard: bool):
     """Update forwarding record"""
-    upd = False
-    nat = NAT().retrieve(ctx.obj.getter)
-    for frw in nat.forwards:
-        if frw.name == name:
-            if max_dst_port is not None and frw.dest_max_port != max_dst_port:
-                frw.dest_max_port = max_dst_port
-                upd = True
-            if min_dst_port is not None and frw.dest_min_port != min_dst_port:
-                frw.dest_min_port = min_dst_port
-                upd = True
-            if min_src_port is not None and frw.src_min_port != min_src_port:
-                frw.src_min_port = min_src_port
-                upd = True
-            if max_src_port is not None and frw.src_max_port != max_src_port:
-                frw.src_max_port = max_src_port
-                upd = True
-            if dest_ip_section is not None and frw.dest_ip_sec != dest_ip_section:
-                frw.dest_ip_sec = dest_ip_section
-                upd = True
-            if proto is not None and frw.type != proto:
-                frw.type = ForwardType[proto]
-                upd = True
-            if upd:
-                print("updating " + str(frw))
-
-    if upd:
-        nat.save(ctx.obj.poster)
-    else:
+    with apply_after(ctx, apply_mode) as poster, NAT.transaction(ctx.obj.getter, poster, guard) as nat:
+        changed = _edit(nat.update, name,
+                        dest_ip_sec=dest_ip_section,
+                        src_min_port=min_src_port,
+                        src_max_port=max_src_port,
+                        dest_min_port=min_dst_port,
+                        dest_max_port=max_dst_port,
+                        type=proto)
+        for frw in changed:
+            print("updating " + str(frw))
+    if not changed:
         print("Nothing to update")
 
 
 @nat.command()
 @click.argument('name')
+@apply_option
+@guard_option
 @click.pass_context
-def remove(ctx, name: str):
+def remove(ctx, name: str, apply_mode: str, guard: bool):
     """Remove forwarding rule"""
-    upd = False
-    nat = NAT().retrieve(ctx.obj.getter)
-    items = []
-    for frw in nat.forwards:
-        if frw.name != name:
-            items.append(frw)
-        else:
-            upd = True
+    with apply_after(ctx, apply_mode) as poster, NAT.transaction(ctx.obj.getter, poster, guard) as nat:
+        changed = nat.remove(name)
+        for frw in changed:
             print("removing " + str(frw))
-    nat.forwards = items
-    if upd:
-        nat.save(ctx.obj.poster)
-    else:
+    if not changed:
         print("nothing to remove")
 
 
 @nat.command()
 @click.argument('name')
+@apply_option
+@guard_option
 @click.pass_context
-def disable(ctx, name: str):
+def disable(ctx, name: str, apply_mode: str, guard: bool):
     """Disable (but not remove) rule"""
-    nat = NAT().retrieve(ctx.obj.getter)
-    upd = False
-    for frw in nat.forwards:
-        if frw.name == name and frw.enabled:
-            frw.enabled = False
-            upd = True
+    with apply_after(ctx, apply_mode) as poster, NAT.transaction(ctx.obj.getter, poster, guard) as nat:
+        changed = nat.disable(name)
+        for frw in changed:
             print("disabling " + str(frw))
-    if upd:
-        nat.save(ctx.obj.poster)
-    else:
+    if not changed:
         print("nothing to disable")
 
 
 @nat.command()
 @click.argument('name')
+@apply_option
+@guard_option
 @click.pass_context
-def enable(ctx, name: str):
+def enable(ctx, name: str, apply_mode: str, guard: bool):
     """Enable rule"""
-    nat = NAT().retrieve(ctx.obj.getter)
-    upd = False
-    for frw in nat.forwards:
-        if frw.name == name and not frw.enabled:
-            frw.enabled = True
-            upd = True
+    with apply_after(ctx, apply_mode) as poster, NAT.transaction(ctx.obj.getter, poster, guard) as nat:
+        changed = nat.enable(name)
+        for frw in changed:
             print("enabling " + str(frw))
-    if upd:
-        nat.save(ctx.obj.poster)
-    else:
+    if not changed:
         print("nothing to enable")
 
 
 @nat.command()
 @click.argument('old_name')
 @click.argument('new_name')
+@apply_option
+@guard_option
 @click.pass_context
-def rename(ctx, old_name, new_name):
+def rename(ctx, old_name, new_name, apply_mode, guard):
     """Rename forwarding rule"""
-    nat = NAT().retrieve(ctx.obj.getter)
-    upd = False
-    for frw in nat.forwards:
-        if frw.name == old_name:
+    with apply_after(ctx, apply_mode) as poster, NAT.transaction(ctx.obj.getter, poster, guard) as nat:
+        changed = _edit(nat.rename, old_name, new_name)
+        for frw in changed:
             print("renaming " + str(frw))
-            upd = True
-            frw.name = new_name
-    if upd:
-        nat.save(ctx.obj.poster)
-    else:
+    if not changed:
         print("nothing to rename")
 
 
+@nat.command()
+@click.argument('source', type=click.File('r'), default='-')
+@click.option('--dry-run', is_flag=True, help='Validate and print changes without saving')
+@apply_option
+@guard_option
+@click.pass_context
+def batch(ctx, source, dry_run, apply_mode, guard):
+    """
+    Apply many operations from file (or stdin) by one read and one save.
+
+    With --guard the table is read once more right before save to keep changes saved by others meanwhile
+    and once more after save to save the operations again if another writer overwrote them.
+
+    Operations are JSON objects, one per line (or JSON array), for example:
+    {"op": "create", "name": "web", "dest_ip_sec": 10, "src_min_port": 80, "src_max_port": 80,
+    "dest_min_port": 80, "dest_max_port": 80, "type": "TCP", "enabled": true}.
+    Supported ops: create, update, remove, enable, disable, rename (with new_name).
+    All operations are applied in memory and saved only if all of them are valid.
+    """
+    operations = _read_operations(source.read())
+    with apply_after(ctx, apply_mode) as poster, \
+            NAT.transaction(ctx.obj.getter, lambda *args: None if dry_run else poster(*args), guard) as nat:
+        for num, operation in enumerate(operations, 1):
+            try:
+                changed = nat.execute(operation)
+            except (ValueError, KeyError, TypeError) as ex:
+                raise click.ClickException("operation #{}: {}".format(num, ex))
+            for frw in changed:
+                print("{} {}".format(operation['op'], frw))
+            if not changed:
+                print("{} {}: nothing to do".format(operation['op'], operation.get('name', '')))
+
+
+@nat.command()
+@click.argument('desired', type=click.File('r'))
+@click.option('--dry-run', is_flag=True, help='Print plan without saving')
+@apply_option
+@guard_option
+@click.pass_context
+def sync(ctx, desired, dry_run, apply_mode, guard):
+    """
+    Make forwarding table equal to desired one.
+
+    DESIRED is JSON file (or - for stdin) with list of rules: objects with fields as in batch create.
+    Table is saved only if it differs from the router one.
+    """
+    import json
+    try:
+        target = NAT([Forward.from_dict(item) for item in json.load(desired)])
+        for frw in target.forwards:
+            frw.validate()
+    except (ValueError, KeyError) as ex:
+        raise click.ClickException("invalid desired table: {}".format(ex))
+    with apply_after(ctx, apply_mode) as poster, \
+            NAT.transaction(ctx.obj.getter, lambda *args: None if dry_run else poster(*args), guard) as nat:
+        plan = _edit(nat.diff, target)
+        print(plan.pretty())
+        nat.forwards = target.forwards
+
+
+def _edit(method: callable, *args, **kwargs):
+    try:
+        return method(*args, **kwargs)
+    except ValueError as ex:
+        raise click.BadParameter(str(ex))
+
+
+def _read_operations(content: str) -> List[dict]:
+    import json
+    if content.lstrip().startswith('['):
+        return json.loads(content)
+    operations = []
+    for line in content.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            operations.append(json.loads(line))
+    return operations
+
+
 if __name__ == '__main__':
     cli(obj=None)
@@ -0,0 +1,159 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Deferred applies: routers with saved but not applied changes are recorded in a state file shared by processes,
+so many small changes end up in one apply (see `router apply --pending`)
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from rvcm.cli import *
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# State file used when --pending-file is not set
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'rvcm', 'pending.json')
+
+
+class PendingApplies:
+    """
+    State file with routers waiting for apply: JSON object router IP -> {first, last, changes}, where `first`
+    and `last` are unix times of the first and the last deferred change. Every update holds exclusive lock
+    (flock of the `.lock` file next to it) and replaces the file atomically
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, path: str = None):
+        """
+        :param path: path of state file (None - DEFAULT_PATH)
+        """
+        self.path = path or DEFAULT_PATH
+
+    def mark(self, ip: str) -> dict:
+        """
+        Record change of the router which is not applied yet
+        :return: pending entry of the router
+        """
+        with self._locked() as state:
+            now = time.time()
+            entry = state.setdefault(ip, {"first": now, "last": now, "changes": 0})
+            entry["last"] = now
+            entry["changes"] += 1
+            return dict(entry)
+
+    def get(self, ip: str):
+        """
+        :return: pending entry of the router or None
+        """
+        return self.all().get(ip)
+
+    def all(self) -> dict:
+        """
+        :return: all pending entries by router IP
+        """
+        with self._locked(write=False) as state:
+            return state
+
+    def clear(self, ip: str, last: float = None) -> bool:
+        """
+        Forget pending apply of the router
+        :param last: forget only if there was no change after this time (`last` of the applied entry)
+        :return: True if entry was removed
+        """
+        with self._locked() as state:
+            entry = state.get(ip)
+            if entry is None or (last is not None and entry["last"] > last):
+                return False
+            del state[ip]
+            return True
+
+    @contextmanager
+    def _locked(self, write=True):
+        with self._lock:
+            folder = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(folder, exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    state = self._read()
+                    yield state
+                    if write:
+                        tmp = "{}.{}".format(self.path, os.getpid())
+                        with open(tmp, 'w', encoding='utf-8') as f:
+                            json.dump(state, f, indent=4)
+                        os.replace(tmp, self.path)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as ex:
+            raise ValueError("broken state file {}: {}".format(self.path, ex))
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(path=" + repr(self.path) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+def apply_option(f):
+    """
+    Add --apply and --defer-apply flags (as `apply_mode`: None, 'now' or 'defer') to command which saves changes
+    """
+    f = click.option('--defer-apply', 'apply_mode', flag_value='defer',
+                     help='Record pending apply for `router apply --pending` instead of applying')(f)
+    return click.option('--apply', 'apply_mode', flag_value='now',
+                        help='Apply changes right after save (if router requires it)')(f)
+
+
+@contextmanager
+def apply_after(ctx: click.Context, mode: str = None):
+    """
+    Yield poster of the router which remembers saves. When block is finished without error and something was
+    saved, apply changes now (mode 'now') or record pending apply in state file (mode 'defer')
+    """
+    context = ctx.obj
+    saved = []
+
+    def poster(*args, **kwargs):
+        saved.append(args[0])
+        return context.poster(*args, **kwargs)
+
+    yield poster
+    if not saved or mode is None:
+        return
+    if mode == 'defer':
+        PendingApplies(ctx.find_root().params.get('pending_file')).mark(context.ip)
+        print("apply deferred")
+        return
+    from rvcm.router import apply_if_required
+    print("applied" if apply_if_required(context.getter, context.poster) else "nothing to apply")
@@ -0,0 +1,201 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Base of data models: slotted records with serialisation generated once per class
+"""
+import sys
+from datetime import datetime
+from collections import OrderedDict
+
+
+class Field:
+    """
+    Field of record in dictionary (and tuple) form
+    """
+    __slots__ = ('key', 'path', 'encode', 'decode')
+
+    def __init__(self, key: str, path: str = None, encode: callable = None, decode: callable = None):
+        """
+        :param key: key in dictionary
+        :param path: attribute (dotted for attribute of nested record), the same as key by default
+        :param encode: conversion of attribute to plain (JSON) value
+        :param decode: conversion of plain value back to attribute (must pass already converted value as is)
+        """
+        self.key = key
+        self.path = path or key
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(key=" + repr(self.key) + ", path=" + repr(self.path) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+def enum_field(key: str, enum: type, path: str = None) -> Field:
+    """
+    Field with Enum member kept by name (name is case insensitive on decode)
+    """
+    return Field(key, path, lambda value: value.name,
+                 lambda value: value if isinstance(value, enum) else enum[str(value).upper()])
+
+
+def int_field(key: str, path: str = None) -> Field:
+    """
+    Field with integer (decoded from string too, e.g. read from CSV)
+    """
+    return Field(key, path, None, lambda value: value if isinstance(value, int) else int(value))
+
+
+_BOOLEANS = {'true': True, '1': True, 'false': False, '0': False, '': False}
+
+
+def _boolean(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    try:
+        return _BOOLEANS[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError("invalid boolean: " + repr(value)) from None
+
+
+def bool_field(key: str, path: str = None) -> Field:
+    """
+    Field with boolean (decoded from True/False or 1/0 strings too, e.g. read from CSV)
+    """
+    return Field(key, path, None, _boolean)
+
+
+_ISO_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# dict keeps insertion order since python 3.7, OrderedDict is required before
+_ORDERED_DICT = sys.version_info >= (3, 7)
+
+
+def datetime_field(key: str, path: str = None) -> Field:
+    """
+    Field with datetime kept in ISO 8601 format
+    """
+    return Field(key, path, lambda value: value.isoformat('T'),
+                 lambda value: value if isinstance(value, datetime) else datetime.strptime(
+                     value, _ISO_FORMAT + '.%f' if '.' in value else _ISO_FORMAT))
+
+
+class Record:
+    """
+    Slotted data model. Subclass declares `__slots__`, FIELDS (Field or key equal to attribute name) and
+    constructor without required arguments. to_dict, to_tuple, from_dict and from_tuple are compiled for the
+    class on first use and replace these generic methods
+    """
+    __slots__ = ()
+    FIELDS = ()
+    # name of record in errors (class name by default)
+    LABEL = None
+
+    def to_dict(self) -> dict:
+        """
+        Convert record to dictionary of plain values with keys of FIELDS (acceptable by from_dict)
+        """
+        return type(self)._compile()['to_dict'](self)
+
+    def to_tuple(self) -> tuple:
+        """
+        Convert record to tuple of plain values in order of FIELDS (acceptable by from_tuple)
+        """
+        return type(self)._compile()['to_tuple'](self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Make record from dictionary. Missing keys keep default values
+        :raise ValueError: if dictionary has unknown key
+        """
+        return cls._compile()['from_dict'](cls, data)
+
+    @classmethod
+    def from_tuple(cls, values):
+        """
+        Make record from values in order of FIELDS
+        """
+        return cls._compile()['from_tuple'](cls, values)
+
+    @classmethod
+    def keys(cls) -> tuple:
+        """
+        Keys of dictionary form in order of FIELDS
+        """
+        return tuple(field.key for field in cls._fields())
+
+    @classmethod
+    def _fields(cls):
+        return [field if isinstance(field, Field) else Field(field) for field in cls.FIELDS]
+
+    @classmethod
+    def _compile(cls) -> dict:
+        fields = cls._fields()
+        env = {'_OrderedDict': OrderedDict, '_keys': frozenset(field.key for field in fields),
+               '_label': cls.LABEL or cls.__name__}
+        getters = []
+        setters = []
+        for num, field in enumerate(fields):
+            getter = 'self.' + field.path
+            if field.encode is not None:
+                env['_encode%d' % num] = field.encode
+                getter = '_encode%d(%s)' % (num, getter)
+            getters.append(getter)
+            value = '{}'
+            if field.decode is not None:
+                env['_decode%d' % num] = field.decode
+                value = '_decode%d({})' % num
+            setters.append((field.key, 'obj.' + field.path + ' = ' + value))
+        if _ORDERED_DICT:
+            to_dict = '{' + ', '.join('%r: %s' % (field.key, getter) for field, getter in zip(fields, getters)) + '}'
+        else:
+            to_dict = '_OrderedDict([' + ', '.join('(%r, %s)' % (field.key, getter)
+                                                    for field, getter in zip(fields, getters)) + '])'
+        source = [
+            'def to_dict(self):',
+            '    return ' + to_dict,
+            'def to_tuple(self):',
+            '    return (' + ''.join(getter + ', ' for getter in getters) + ')',
+            'def from_dict(cls, data):',
+            '    if not _keys.issuperset(data):',
+            '        raise ValueError("unknown {} field: {}".format(_label, ", ".join(sorted(set(data) - _keys))))',
+            '    obj = cls()',
+        ]
+        for key, setter in setters:
+            source += ['    if %r in data:' % key, '        ' + setter.format('data[%r]' % key)]
+        source += ['    return obj', 'def from_tuple(cls, values):', '    obj = cls()']
+        source += ['    ' + setter.format('values[%d]' % num) for num, (key, setter) in enumerate(setters)]
+        source += ['    return obj']
+        exec(compile('\n'.join(source), '<{} serialisation>'.format(cls.__name__), 'exec'), env)
+        methods = {name: env[name] for name in ('to_dict', 'to_tuple', 'from_dict', 'from_tuple')}
+        cls.to_dict = methods['to_dict']
+        cls.to_tuple = methods['to_tuple']
+        cls.from_dict = classmethod(methods['from_dict'])
+        cls.from_tuple = classmethod(methods['from_tuple'])
+        return methods
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + ", ".join(
+            name + "=" + repr(getattr(self, name)) for name in self.__slots__) + ")"
+
+    def __str__(self):
+        return repr(self)
@@ -19,16 +19,39 @@ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER I
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 from rvcm.cli import *
-from lxml import html
+from rvcm import trace
+from rvcm.formats import format_option, write_record
+from rvcm.records import Record, Field, bool_field
 import json
+import time
+import re
 
+# Banner of index page when there are not applied changes
+_APPLY_PATTERN = re.compile(r'(?:^|[\r\n])var headMsg = "Please do Apply to make the changes take effect\.";'
+                            r'(?=[\r\n]|$)')
+# Form with status tables
+_FORM_PATTERN = re.compile(r'<form\b[^>]*\baction="setup\.cgi"[^>]*>.*?</form>', re.S)
+# Tables of WAN, phone, device and LAN sections inside the form (compiled on first use to import lxml lazily)
+_SECTIONS = []
 
-class Info:
+
+class Info(Record):
     """
     Describes full information about router status
     """
+    __slots__ = ('ip', 'gateway', 'mac', 'sip_user', 'local_ip', 'dns1', 'dns2', 'firmware', 'model', 'gpon_serial',
+                 'phone_line_up', 'wan_line_up', 'lan_line_up', 'apply_required')
+    # keys of dictionary form (as in router export)
+    FIELDS = ('model', 'ip', 'gateway', 'mac', 'local_ip', 'dns1', 'dns2', Field('sip', 'sip_user'),
+              Field('gpon', 'gpon_serial'), 'firmware', bool_field('phone_status', 'phone_line_up'),
+              bool_field('wan_status', 'wan_line_up'), bool_field('lan_status', 'lan_line_up'),
+              bool_field('unsaved_changes', 'apply_required'))
     # URL to page with full information
     URL = '/index.htm'
+    # Parser of index page: 'fast' (precompiled lookups of sections, form-only tree) or 'tree' (lookups of
+    # every field from the form root). Both give the same result on router pages
+    ENGINE = 'fast'
+    ENGINES = ('fast', 'tree')
 
     def __init__(self, ip='', gateway='', mac='', sip_user='', local_ip='', dns1='', dns2='', firmware='', model='',
                  gpon_serial='', phone_line_up=False, wan_line_up=False, lan_line_up=False, apply_required=False):
@@ -47,11 +70,56 @@ class Info:
         self.lan_line_up = lan_line_up
         self.apply_required = apply_required
 
-    def parse(self, page: str):
+    def parse(self, page: str, engine: str = None):
         """
         Parse index HTML page and gather info
         :param page: Content of index page
+        :param engine: parser engine (one of ENGINES), by default Info.ENGINE
         """
+        engine = engine or self.ENGINE
+        if engine not in self.ENGINES:
+            raise ValueError("unknown parser engine: " + repr(engine))
+        with trace.span('parse.info', engine=engine) as fields:
+            if engine == 'fast':
+                self._parse_fast(page)
+            else:
+                self._parse_tree(page)
+            fields['firmware'] = self.firmware
+
+    def _parse_fast(self, page: str):
+        from lxml import html, etree
+        if not _SECTIONS:
+            _SECTIONS[:] = [etree.XPath('(.//table/tr[{}]/td/table)[1]'.format(row)) for row in (2, 4, 6, 8)]
+        found = _FORM_PATTERN.search(page)
+        try:
+            form = html.fragment_fromstring(found.group(0))
+            wan, phone, device, lan = [_rows(section(form)[0]) for section in _SECTIONS]
+
+            self.wan_line_up = '"Up"' in _script(wan[1][3]).text
+            self.ip = wan[2][1].text
+            self.gateway = wan[2][3].text
+            self.dns1 = wan[3][1].text
+            self.dns2 = wan[3][3].text
+
+            self.phone_line_up = '"Up"' in _script(phone[2][1]).text
+            self.sip_user = phone[3][1].text
+
+            self.model = device[1][1].text
+            self.firmware = device[1][3].text
+            self.gpon_serial = device[2][1].text
+            self.mac = device[2][3].text
+
+            self.local_ip = lan[1][1].text
+            self.lan_line_up = '"Connected"' in _script(lan[1][3]).text
+        except (AttributeError, etree.ParserError, TypeError, IndexError, StopIteration):
+            # not the usual layout: let the tree engine look for fields anywhere in the page
+            self._parse_tree(page)
+            return
+
+        self.apply_required = _APPLY_PATTERN.search(page) is not None
+
+    def _parse_tree(self, page: str):
+        from lxml import html
         root = html.fromstring(page)
         form = root.find('.//form[@action="setup.cgi"]')
 
@@ -88,6 +156,16 @@ class Info:
         self.parse(resp.text)
         return self
 
+    async def retrieve_async(self, requester: callable):
+        """
+        Get router status asynchronously
+        :param requester: coroutine function that returns page by url (see rvcm.aio.AsyncContext)
+        :return: self
+        """
+        resp = await requester(self.URL)
+        self.parse(resp.text)
+        return self
+
     def pretty(self):
         """
         Make pretty-printed text with router info
@@ -111,11 +189,118 @@ class Info:
         lines += ["Unsaved changes : {}".format("Yes" if self.apply_required else "No")]
         return "\n".join(lines)
 
-    def __repr__(self):
-        return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
 
-    def __str__(self):
-        return repr(self)
+# URL to apply saved changes
+APPLY_URL = '/setup.cgi?l0=-1&l1=-1&l2=-1&l3=-1'
+
+
+def apply_changes(poster: callable):
+    """
+    Apply saved changes on the router
+    :param poster: function that post data to router by URL
+    """
+    with trace.span('apply'):
+        poster(APPLY_URL, {
+            'todo': 'apply',
+            'this_file': 'global_nav.htm',
+            'next_file': 'index.html'
+        })
+
+
+def apply_if_required(requester: callable, poster: callable, force=False) -> bool:
+    """
+    Apply saved changes only if router reports them (Info.apply_required)
+    :param requester: function that returns text by url
+    :param poster: function that post data to router by URL
+    :param force: apply without check
+    :return: True if apply was sent
+    """
+    if not force and not Info().retrieve(requester).apply_required:
+        return False
+    apply_changes(poster)
+    return True
+
+
+class Watcher:
+    """
+    Polls router status and reports only changes. Polls are fast (every `interval`) after a change or failure
+    and slow down by `backoff` times with every quiet poll, up to `max_interval`
+    """
+
+    def __init__(self, requester: callable, interval: float = 5.0, max_interval: float = 60.0, backoff: float = 1.5):
+        """
+        :param requester: function that returns text by url
+        :param interval: seconds between polls after change or failure
+        :param max_interval: maximum seconds between polls of stable router
+        :param backoff: multiplier of delay after poll without changes
+        """
+        self.requester = requester
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.backoff = backoff
+        self.delay = interval
+        self.last = None
+        self.error = None
+
+    def poll(self):
+        """
+        Retrieve status and compare it with previous one
+        :return: list of events (dictionaries with `event` key: snapshot, change, error or recovered), empty if
+        nothing changed. The first successful poll after failure gives `recovered` before snapshot or change
+        """
+        try:
+            current = Info().retrieve(self.requester).to_dict()
+        except Exception as ex:
+            self.delay = self.interval
+            error = "{}: {}".format(ex.__class__.__name__, ex)
+            if error == self.error:
+                return []
+            self.error = error
+            return [{"event": "error", "error": error}]
+        previous, self.last = self.last, current
+        events = []
+        if self.error is not None:
+            self.error = None
+            events.append({"event": "recovered"})
+        if previous is None:
+            self.delay = self.interval
+            return events + [{"event": "snapshot", "info": current}]
+        changes = {key: [previous.get(key), value] for key, value in current.items() if previous.get(key) != value}
+        if changes:
+            self.delay = self.interval
+            return events + [{"event": "change", "changes": changes}]
+        self.delay = min(self.max_interval, self.delay * self.backoff)
+        return events
+
+
+def _rows(table):
+    # cells of table by rows
+    return [[td for td in tr if td.tag == 'td'] for tr in table if tr.tag == 'tr']
+
+
+def _script(cell):
+    return next(child for child in cell if child.tag == 'script')
+
+
+_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def _duration(ctx, param, value):
+    # 500ms, 5s, 2m, 1h or plain seconds
+    text = str(value).strip().lower()
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            text, scale = text[:-len(unit)], _UNITS[unit]
+            break
+    else:
+        scale = 1
+    try:
+        seconds = float(text) * scale
+    except ValueError:
+        raise click.BadParameter("expected duration like 500ms, 5s, 2m or 1h: " + repr(value))
+    if seconds <= 0:
+        raise click.BadParameter("duration must be positive")
+    return seconds
 
 
 @cli.group()
@@ -127,16 +312,31 @@ def router():
 
 
 @router.command()
+@click.option('--force', is_flag=True, help='Apply even if router reports no saved changes')
+@click.option('--pending', is_flag=True, help='Apply only if changes were deferred by --defer-apply')
+@click.option('--debounce', default='5s', callback=_duration,
+              help='With --pending: wait until no change was deferred for this time')
 @click.pass_context
-def apply(ctx):
+def apply(ctx, force, pending, debounce):
     """
     Apply changes on the router
     """
-    ctx.obj.poster('/setup.cgi?l0=-1&l1=-1&l2=-1&l3=-1', {
-        'todo': 'apply',
-        'this_file': 'global_nav.htm',
-        'next_file': 'index.html'
-    })
+    if not pending:
+        print("applied" if apply_if_required(ctx.obj.getter, ctx.obj.poster, force) else "nothing to apply")
+        return
+    from rvcm.pending import PendingApplies
+    state = PendingApplies(ctx.find_root().params.get('pending_file'))
+    entry = state.get(ctx.obj.ip)
+    # changes deferred during the wait are applied by the same apply
+    while entry is not None and time.time() - entry['last'] < debounce:
+        time.sleep(debounce - (time.time() - entry['last']))
+        entry = state.get(ctx.obj.ip)
+    if entry is None:
+        print("nothing pending")
+        return
+    applied = apply_if_required(ctx.obj.getter, ctx.obj.poster, force)
+    state.clear(ctx.obj.ip, entry['last'])
+    print("{} ({} deferred change(s))".format("applied" if applied else "nothing to apply", entry['changes']))
 
 
 @router.command()
@@ -148,27 +348,30 @@ def info(ctx):
 
 
 @router.command()
+@format_option
 @click.pass_context
-def export(ctx):
-    """Print details about router in json"""
+def export(ctx, fmt):
+    """Print details about router in JSON, NDJSON, CSV or MessagePack"""
     info = Info().retrieve(ctx.obj.getter)
-    data = {
-        "model": info.model,
-        "ip": info.ip,
-        "gateway": info.gateway,
-        "mac": info.mac,
-        "local_ip": info.local_ip,
-        "dns1": info.dns1,
-        "dns2": info.dns2,
-        "sip": info.sip_user,
-        "gpon": info.gpon_serial,
-        "firmware": info.firmware,
-        "phone_status": info.phone_line_up,
-        "wan_status": info.wan_line_up,
-        "lan_status": info.lan_line_up,
-        "unsaved_changes": info.apply_required,
-    }
-    print(json.dumps(data, ensure_ascii=False, indent=4))
+    write_record(info, fmt)
+
+
+@router.command()
+@click.option('--interval', default='5s', callback=_duration, help='Poll interval after change or failure')
+@click.option('--max-interval', default='60s', callback=_duration, help='Maximum poll interval of stable router')
+@click.option('--backoff', type=float, default=1.5, help='Multiplier of interval after poll without changes')
+@click.pass_context
+def watch(ctx, interval, max_interval, backoff):
+    """Print JSON line when router status changes"""
+    watcher = Watcher(ctx.obj.getter, interval, max_interval, backoff)
+    try:
+        while True:
+            for event in watcher.poll():
+                event = dict(event, time=time.strftime('%Y-%m-%dT%H:%M:%S%z'), router=ctx.obj.ip)
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+            time.sleep(watcher.delay)
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
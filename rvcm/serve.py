@@ -0,0 +1,358 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import os
+import json
+import time
+import queue
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import Future
+from rvcm.cli import *
+from rvcm.router import Info, apply_if_required
+from rvcm.nat import NAT, Forward
+from rvcm.calls import History
+from rvcm.fleet import targets
+
+
+class Agent:
+    """
+    Warm connection to single router: keeps session, cached resources (info, nat, calls) and executes all
+    changes one by one in own thread. With `apply_debounce` NAT changes are applied by one apply when there
+    were no other changes for this time (and on close)
+    """
+    RESOURCES = {
+        'info': lambda getter: Info().retrieve(getter).to_dict(),
+        'nat': lambda getter: [frw.to_dict() for frw in NAT().retrieve(getter).forwards],
+        'calls': lambda getter: [call.to_dict() for call in History().stream(getter)],
+    }
+
+    def __init__(self, context: Context, refresh: float = 5.0, apply_debounce: float = 0):
+        """
+        :param context: connection to router (closed by agent)
+        :param refresh: maximum age of served resources in seconds
+        :param apply_debounce: apply NAT changes after this number of seconds without changes (0 - never)
+        """
+        self.context = context
+        self.refresh = refresh
+        self.apply_debounce = apply_debounce
+        self._apply_timer = None
+        self._apply_lock = threading.Lock()
+        self._resources = {}
+        self._locks = {name: threading.Lock() for name in self.RESOURCES}
+        # generation of resources is changed by every write: downloads started before it are not cached
+        self._generation = 0
+        self._state_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='writer-' + context.ip, daemon=True)
+        self._writer.start()
+
+    def read(self, name: str):
+        """
+        Get resource not older than refresh interval. Concurrent readers wait for the same download
+        :param name: one of RESOURCES
+        :return: (data, age in seconds)
+        """
+        with self._locks[name]:
+            stamp, data = self._resources.get(name, (None, None))
+            if stamp is None or time.monotonic() - stamp > self.refresh:
+                generation = self._generation
+                data = self.RESOURCES[name](self.context.getter)
+                stamp = time.monotonic()
+                with self._state_lock:
+                    if generation == self._generation:
+                        self._resources[name] = (stamp, data)
+        return data, time.monotonic() - stamp
+
+    def write(self, job: callable):
+        """
+        Execute change in the writer thread of the router and wait for result
+        :param job: function that receives context and returns result
+        :return: result of job
+        """
+        future = Future()
+        self._writes.put((job, future))
+        return future.result()
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            job, future = item
+            try:
+                result = job(self.context)
+            except Exception as ex:
+                self._invalidate()
+                future.set_exception(ex)
+                continue
+            # table as stored by router (read from response of save): next read needs no request
+            stored = result.get('nat') if isinstance(result, dict) else None
+            self._invalidate(stored)
+            if stored is not None and result.get('changed') and self.apply_debounce:
+                self._defer_apply()
+            future.set_result(result)
+
+    def _invalidate(self, nat: list = None):
+        with self._state_lock:
+            self._generation += 1
+            self._resources.clear()
+            if nat is not None:
+                self._resources['nat'] = (time.monotonic(), nat)
+
+    def _defer_apply(self):
+        # every change restarts the timer, so a burst of changes ends with one apply
+        with self._apply_lock:
+            if self._apply_timer is not None:
+                self._apply_timer.cancel()
+            self._apply_timer = threading.Timer(self.apply_debounce, self._apply_deferred)
+            self._apply_timer.daemon = True
+            self._apply_timer.start()
+
+    def _apply_deferred(self):
+        with self._apply_lock:
+            if self._apply_timer is None:
+                return
+            self._apply_timer = None
+        future = Future()
+        future.add_done_callback(_report_failure)
+        self._writes.put((apply_job, future))
+
+    def close(self):
+        """
+        Apply deferred changes, stop writer and close connection
+        """
+        with self._apply_lock:
+            timer, self._apply_timer = self._apply_timer, None
+        if timer is not None:
+            timer.cancel()
+            future = Future()
+            future.add_done_callback(_report_failure)
+            self._writes.put((apply_job, future))
+        self._writes.put(None)
+        self._writer.join()
+        self.context.close()
+
+
+def sync_nat(rules: list):
+    """
+    Make job for Agent.write that replaces forwarding table by rules (list of Forward dictionaries)
+    :raise ValueError: if rules are not list of objects or some rule is invalid
+    """
+    _check_objects(rules, 'rules')
+    target = NAT([Forward.from_dict(item) for item in rules])
+    for frw in target.forwards:
+        frw.validate()
+
+    def job(context):
+        with NAT.transaction(context.getter, context.poster) as nat:
+            plan = nat.diff(target)
+            nat.forwards = target.forwards
+        return {"changed": bool(plan), "plan": plan.pretty(), "nat": [frw.to_dict() for frw in nat.forwards]}
+
+    return job
+
+
+def batch_nat(operations: list):
+    """
+    Make job for Agent.write that executes NAT operations (see NAT.execute) by one save
+    :raise ValueError: if operations are not list of objects
+    """
+    _check_objects(operations, 'operations')
+
+    def job(context):
+        changed = []
+        with NAT.transaction(context.getter, context.poster) as nat:
+            for operation in operations:
+                changed += [str(frw) for frw in nat.execute(operation)]
+        return {"changed": changed, "nat": [frw.to_dict() for frw in nat.forwards]}
+
+    return job
+
+
+def _check_objects(items, what: str):
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(what + " must be JSON list of objects")
+
+
+def apply_job(context, force=False):
+    return {"applied": apply_if_required(context.getter, context.poster, force)}
+
+
+def _report_failure(future: Future):
+    # result of deferred apply has no waiting client
+    ex = future.exception()
+    if ex is not None:
+        import sys
+        print("deferred apply failed: {}: {}".format(ex.__class__.__name__, ex), file=sys.stderr, flush=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    JSON API of agents:
+
+    GET  /routers                        - list of routers
+    GET  /routers/<ip>/(info|nat|calls)  - router resource
+    POST /routers/<ip>/nat               - replace forwarding table (body: list of rules)
+    POST /routers/<ip>/nat/batch         - apply NAT operations (body: list of operations)
+    POST /routers/<ip>/apply             - apply saved changes if router requires it (body: {"force": true} to
+                                           apply without check)
+
+    Both NAT changes answer with resulting table (`nat`) as stored by router.
+    """
+    server_version = 'rvcm'
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # headers and body are written separately: do not wait for delayed ACK of TCP client between them
+        self.disable_nagle_algorithm = isinstance(self.server, TCPServer)
+        super().setup()
+
+    def _route(self):
+        """
+        Split path into router id and the rest. Router ids may contain '/' (e.g. routers of emulator), so the
+        longest known id that prefixes the path wins
+        :return: (router id or None, list of remaining path parts)
+        """
+        path = self.path.split('?')[0].strip('/')
+        if not path.startswith('routers/'):
+            return None, []
+        rest = path[len('routers/'):]
+        ip, _, tail = rest.partition('/')
+        if ip not in self.server.agents:
+            ip = next((key for key in self.server.routes if rest.startswith(key + '/')), None)
+            if ip is None:
+                return None, []
+            tail = rest[len(ip) + 1:]
+        return ip, tail.split('/')
+
+    def do_GET(self):
+        agents = self.server.agents
+        if self.path.split('?')[0].strip('/') == 'routers':
+            return self._reply(200, sorted(agents))
+        ip, parts = self._route()
+        if ip is None or len(parts) != 1 or parts[0] not in Agent.RESOURCES:
+            return self._reply(404, {"error": "not found"})
+        try:
+            data, age = agents[ip].read(parts[0])
+        except Exception as ex:
+            return self._reply(502, {"error": "{}: {}".format(ex.__class__.__name__, ex)})
+        self._reply(200, data, {'Age': str(int(age))})
+
+    def do_POST(self):
+        agents = self.server.agents
+        ip, parts = self._route()
+        if ip is None:
+            return self._reply(404, {"error": "not found"})
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            payload = json.loads(body.decode('utf-8')) if body else None
+            if parts == ['nat']:
+                job = sync_nat(payload)
+            elif parts == ['nat', 'batch']:
+                job = batch_nat(payload)
+            elif parts == ['apply']:
+                force = isinstance(payload, dict) and bool(payload.get('force'))
+                job = lambda context: apply_job(context, force)
+            else:
+                return self._reply(404, {"error": "not found"})
+        except (ValueError, KeyError, TypeError) as ex:
+            return self._reply(400, {"error": str(ex)})
+        try:
+            self._reply(200, agents[ip].write(job))
+        except (ValueError, KeyError, TypeError) as ex:
+            self._reply(400, {"error": str(ex)})
+        except Exception as ex:
+            self._reply(502, {"error": "{}: {}".format(ex.__class__.__name__, ex)})
+
+    def _reply(self, code, data, headers=None):
+        content = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TCPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(agents: dict, listen: str = '127.0.0.1:8642', socket_path: str = None, verbose=False):
+    """
+    Make HTTP server of agents
+    :param agents: agents by router IP
+    :param listen: host:port for TCP server
+    :param socket_path: path of Unix socket (used instead of TCP if set)
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixServer(socket_path, Handler)
+    else:
+        host, _, port = listen.rpartition(':')
+        server = TCPServer((host or '127.0.0.1', int(port)), Handler)
+    server.agents = agents
+    # router ids from the longest: lookup of ids with '/' in path
+    server.routes = sorted(agents, key=len, reverse=True)
+    server.verbose = verbose
+    return server
+
+
+@cli.command()
+@click.option('--listen', default='127.0.0.1:8642', help='Address of HTTP API (host:port)')
+@click.option('--socket', 'socket_path', default=None, help='Serve HTTP API on Unix socket instead of TCP')
+@click.option('--refresh', type=float, default=5.0, help='Maximum age of served router data in seconds')
+@click.option('--apply-debounce', type=float, default=0,
+              help='Apply NAT changes after this number of seconds without other changes (0 - only by API)')
+@click.option('--verbose', is_flag=True, help='Log requests')
+@click.pass_context
+def serve(ctx, listen, socket_path, refresh, apply_debounce, verbose):
+    """
+    Serve router (or whole inventory) state as JSON API
+    """
+    params = ctx.find_root().params
+    factory = context_factory(params)
+    agents = {target.ip: Agent(factory(target), refresh, apply_debounce) for target in targets(params)}
+    server = make_server(agents, listen, socket_path, verbose)
+    print("serving {} router(s) on {}".format(len(agents), socket_path or listen), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for agent in agents.values():
+            agent.close()
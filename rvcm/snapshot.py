@@ -0,0 +1,117 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Snapshot of whole router state (info, NAT rules and calls) taken by concurrent requests
+"""
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from rvcm.cli import *
+from rvcm.router import Info
+from rvcm.nat import NAT
+from rvcm.calls import History
+
+
+class Snapshot:
+    """
+    Full state of router. Pages are requested at the same time (Context keeps the number of requests within
+    concurrency limit of the router) and every page is parsed as soon as it's downloaded, while others are still
+    on the way
+    """
+
+    def __init__(self):
+        self.info = Info()
+        self.nat = NAT()
+        self.history = History()
+        # time of snapshot (local)
+        self.taken = None
+        # page -> {start, fetch, parse} in seconds: start is offset from beginning of snapshot
+        self.timings = {}
+        # wall-clock time of whole snapshot in seconds
+        self.elapsed = None
+
+    @property
+    def pages(self):
+        """
+        Parts of snapshot: name -> model with URL and parse method. The largest page goes first, so its parsing
+        overlaps downloads of the others when router accepts fewer requests than pages
+        """
+        return {'calls': self.history, 'info': self.info, 'nat': self.nat}
+
+    def retrieve(self, requester: callable):
+        """
+        Get full state of router
+        :param requester: function that returns text by url (thread-safe, like Context.getter)
+        :return: self
+        """
+        self.taken = datetime.now().replace(microsecond=0)
+        self.timings = {}
+        started = time.perf_counter()
+
+        def fetch(name, model):
+            begin = time.perf_counter()
+            resp = requester(model.URL)
+            fetched = time.perf_counter()
+            model.parse(resp.text)
+            self.timings[name] = {
+                "start": round(begin - started, 3),
+                "fetch": round(fetched - begin, 3),
+                "parse": round(time.perf_counter() - fetched, 3),
+            }
+
+        pages = self.pages
+        with ThreadPoolExecutor(max_workers=len(pages)) as pool:
+            futures = [pool.submit(fetch, name, model) for name, model in pages.items()]
+        for future in futures:
+            # the first failed page fails the whole snapshot
+            future.result()
+        self.elapsed = round(time.perf_counter() - started, 3)
+        return self
+
+    def to_dict(self) -> dict:
+        """
+        Convert snapshot to dictionary (as in snapshot command)
+        """
+        return {
+            "taken": self.taken.isoformat() if self.taken else None,
+            "info": self.info.to_dict(),
+            "nat": [forward.to_dict() for forward in self.nat.forwards],
+            "calls": [call.to_dict() for call in self.history.calls],
+            "timings": dict(((name, self.timings.get(name)) for name in ('info', 'nat', 'calls')), total=self.elapsed),
+        }
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + ",\n   ".join(k + "=" + repr(v) for k, v in self.__dict__.items()) + ")"
+
+    def __str__(self):
+        return repr(self)
+
+
+@cli.command()
+@click.pass_context
+def snapshot(ctx):
+    """Print info, NAT rules and calls of router in one JSON document"""
+    result = Snapshot().retrieve(ctx.obj.getter).to_dict()
+    print(json.dumps(dict(router=ctx.obj.ip, **result), ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    cli(obj=None)
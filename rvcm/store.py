@@ -0,0 +1,157 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import sqlite3
+from datetime import datetime
+from typing import Iterable, Iterator
+from rvcm.calls import Call, Abonent, CallTable
+
+
+class CallStore:
+    """
+    Local SQLite storage of calls history collected from routers. Calls are deduplicated by
+    (router, line, stamp, calling phone, called phone) and each router has high-water mark - stamp of
+    the latest stored call, so collection inserts only newer records
+    """
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS calls (
+        router TEXT NOT NULL,
+        line INTEGER NOT NULL,
+        direction TEXT NOT NULL,
+        status TEXT NOT NULL,
+        calling_phone TEXT NOT NULL,
+        calling_ip TEXT NOT NULL,
+        called_phone TEXT NOT NULL,
+        called_ip TEXT NOT NULL,
+        duration INTEGER NOT NULL,
+        stamp TEXT NOT NULL,
+        UNIQUE (router, line, stamp, calling_phone, called_phone)
+    );
+    CREATE INDEX IF NOT EXISTS calls_stamp ON calls (stamp);
+    CREATE INDEX IF NOT EXISTS calls_router_stamp ON calls (router, stamp);
+    CREATE TABLE IF NOT EXISTS watermarks (
+        router TEXT PRIMARY KEY,
+        stamp TEXT NOT NULL
+    );
+    '''
+    STAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+    def __init__(self, path: str):
+        """
+        :param path: path to database file (created if not exists)
+        """
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.executescript(self.SCHEMA)
+
+    def watermark(self, router: str):
+        """
+        Stamp of the latest stored call of the router
+        :return: datetime or None if nothing stored
+        """
+        row = self.db.execute('SELECT stamp FROM watermarks WHERE router = ?', (router,)).fetchone()
+        return datetime.strptime(row[0], self.STAMP_FORMAT) if row else None
+
+    def collect(self, router: str, calls: Iterable[Call]) -> int:
+        """
+        Store calls which are not older than the router high-water mark. When calls come from the newest
+        to the oldest, iteration stops at the first call older than the mark
+        :param router: router name (IP)
+        :param calls: calls from router log (usually History.stream)
+        :return: number of inserted calls
+        """
+        mark = self.watermark(router)
+        latest = mark
+        inserted = 0
+        previous = None
+        with self.db:
+            for call in calls:
+                if mark is not None and call.stamp < mark:
+                    if previous is not None and previous.stamp > call.stamp:
+                        # log is ordered from new to old: the rest is already stored
+                        break
+                    previous = call
+                    continue
+                previous = call
+                cursor = self.db.execute(
+                    'INSERT OR IGNORE INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (router, call.line, call.direction, call.status, call.calling.phone, call.calling.ip,
+                     call.called.phone, call.called.ip, call.duration, call.stamp.strftime(self.STAMP_FORMAT)))
+                inserted += cursor.rowcount
+                if latest is None or call.stamp > latest:
+                    latest = call.stamp
+            if latest is not None and latest != mark:
+                self.db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?)',
+                                (router, latest.strftime(self.STAMP_FORMAT)))
+        return inserted
+
+    def calls(self, router: str = None, since: datetime = None) -> Iterator[Call]:
+        """
+        Get stored calls ordered by stamp
+        :param router: only calls of the router
+        :param since: only calls started at this time or later
+        :return: iterator of calls
+        """
+        query, args = self._select('line, direction, status, calling_phone, calling_ip, called_phone, called_ip, '
+                                   'duration, stamp', router, since)
+        for line, direction, status, calling_phone, calling_ip, called_phone, called_ip, duration, stamp \
+                in self.db.execute(query, args):
+            yield Call(line=line,
+                       direction=direction,
+                       calling=Abonent(phone=calling_phone, ip=calling_ip),
+                       called=Abonent(phone=called_phone, ip=called_ip),
+                       duration_seconds=duration,
+                       stamp=datetime.strptime(stamp, self.STAMP_FORMAT),
+                       status=status)
+
+    def table(self, router: str = None, since: datetime = None) -> CallTable:
+        """
+        Get stored calls ordered by stamp as compact table (without intermediate Call objects)
+        :param router: only calls of the router
+        :param since: only calls started at this time or later
+        """
+        query, args = self._select("line, direction, status, calling_phone, calling_ip, called_phone, called_ip, "
+                                   "duration, CAST(strftime('%s', stamp) AS INTEGER)", router, since)
+        table = CallTable()
+        append = table.append_row
+        for row in self.db.execute(query, args):
+            append(*row)
+        return table
+
+    def _select(self, columns: str, router: str = None, since: datetime = None):
+        query = 'SELECT ' + columns + ' FROM calls WHERE 1 = 1'
+        args = []
+        if router:
+            query += ' AND router = ?'
+            args.append(router)
+        if since is not None:
+            query += ' AND stamp >= ?'
+            args.append(since.strftime(self.STAMP_FORMAT))
+        query += ' ORDER BY stamp'
+        return query, args
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,253 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Instrumentation of requests, parsing and saving: timing spans delivered to pluggable hooks and process-wide
+counters. Without hooks spans cost almost nothing.
+
+Span is a dictionary: `span` (name), `start` (unix time), `duration` and `self` (duration without nested spans)
+in seconds, `parent` (name of enclosing span or None), `thread` and fields of the span (router, url, status...).
+Phases:
+
+    http.request    whole request made by Context (self time - sending request and downloading body)
+    http.connect    DNS lookup and TCP connection
+    http.challenge  round trip rejected by router with Digest challenge (401)
+    http.wait       from request sent until response headers received (router renders page)
+    parse.*         parsing of page (parse.calls of streamed log includes download)
+    save.*, apply   making and sending change (without nested request)
+"""
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+_hooks = []
+_counters = Counter()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def add_hook(hook: callable):
+    """
+    Deliver every finished span to hook (called from the thread which made the span)
+    """
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: callable):
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def count(name: str, value: int = 1):
+    """
+    Increase counter (requests, bytes, retries, errors, challenges, connections, cache_hits)
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """
+    Zero counters
+    """
+    with _lock:
+        _counters.clear()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def emit(name: str, duration: float, **fields):
+    """
+    Report span measured by caller (it is treated as nested in the current span)
+    """
+    stack = _stack()
+    if stack:
+        stack[-1][1] += duration
+    if not _hooks:
+        return
+    _deliver(name, time.time() - duration, duration, duration, stack[-1][0] if stack else None, fields)
+
+
+def _deliver(name, start, duration, own, parent, fields):
+    record = dict(span=name, start=round(start, 6), duration=round(duration, 6), self=round(max(own, 0.0), 6),
+                  parent=parent, thread=threading.current_thread().name)
+    record.update(fields)
+    for hook in list(_hooks):
+        hook(record)
+
+
+@contextmanager
+def span(name: str, **fields):
+    """
+    Measure block. Block may add fields to yielded dictionary (status, bytes...)
+    """
+    stack = _stack()
+    entry = [name, 0.0]
+    stack.append(entry)
+    started = time.perf_counter()
+    start = time.time()
+    try:
+        yield fields
+    except Exception as ex:
+        fields['error'] = ex.__class__.__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][1] += duration
+        if _hooks:
+            _deliver(name, start, duration, duration - entry[1], stack[-1][0] if stack else None, fields)
+
+
+def timed_iter(name: str, iterable, **fields):
+    """
+    Iterate and report one span with time spent only inside the iterable (not in the consumer)
+    """
+    iterator = iter(iterable)
+    spent = 0.0
+    items = 0
+    start = time.time()
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            items += 1
+            yield item
+    finally:
+        if _hooks:
+            _deliver(name, start, spent, spent, _stack()[-1][0] if _stack() else None, dict(fields, items=items))
+
+
+class JsonLines:
+    """
+    Hook writing spans as JSON lines
+    """
+
+    def __init__(self, stream=None):
+        import json
+        self._dumps = json.dumps
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        line = self._dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+class Profile:
+    """
+    Hook aggregating self time of spans by phase and by router
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}  # name -> [count, self seconds, max duration]
+        self.routers = {}  # router -> [requests, seconds in requests]
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        with self._lock:
+            phase = self.phases.setdefault(record['span'], [0, 0.0, 0.0])
+            phase[0] += 1
+            phase[1] += record['self']
+            phase[2] = max(phase[2], record['duration'])
+            if record['span'] == 'http.request' and 'router' in record:
+                router = self.routers.setdefault(record['router'], [0, 0.0])
+                router[0] += 1
+                router[1] += record['duration']
+
+    def report(self) -> str:
+        """
+        Table of phases by self time (`other` - time out of spans: startup, command logic, output)
+        """
+        wall = time.perf_counter() - self.started
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: -item[1][1])
+            routers = sorted(self.routers.items(), key=lambda item: -item[1][1])
+        lines = ["{:16s} {:>7s} {:>10s} {:>6s} {:>10s}".format("PHASE", "COUNT", "SELF-MS", "%", "MAX-MS")]
+        covered = 0.0
+        for name, (number, own, longest) in phases:
+            covered += own
+            lines.append("{:16s} {:7d} {:10.1f} {:6.1f} {:10.1f}".format(
+                name, number, own * 1000, own * 100 / wall if wall else 0, longest * 1000))
+        other = max(0.0, wall - covered)
+        lines.append("{:16s} {:>7s} {:10.1f} {:6.1f}".format("other", "", other * 1000,
+                                                           other * 100 / wall if wall else 0))
+        lines.append("{:16s} {:>7s} {:10.1f}".format("total", "", wall * 1000))
+        if len(routers) > 1:
+            lines.append("")
+            lines.append("{:32s} {:>8s} {:>10s}".format("ROUTER", "REQUESTS", "HTTP-MS"))
+            for router, (number, spent) in routers:
+                lines.append("{:32s} {:8d} {:10.1f}".format(router, number, spent * 1000))
+        numbers = counters()
+        if numbers:
+            lines.append("")
+            lines.append(" ".join("{}={}".format(key, value) for key, value in sorted(numbers.items())))
+        return "\n".join(lines)
+
+
+def instrument_adapter(adapter):
+    """
+    Make connections of requests adapter report http.connect, http.challenge and http.wait spans
+    """
+    from urllib3.connection import HTTPConnection
+    from urllib3.connectionpool import HTTPConnectionPool
+
+    class TimedConnection(HTTPConnection):
+        def connect(self):
+            count('connections')
+            with span('http.connect', host=self.host, port=self.port):
+                super().connect()
+
+        def getresponse(self, *args, **kwargs):
+            started = time.perf_counter()
+            response = super().getresponse(*args, **kwargs)
+            if response.status == 401:
+                count('challenges')
+            emit('http.challenge' if response.status == 401 else 'http.wait', time.perf_counter() - started,
+                 status=response.status)
+            return response
+
+    class TimedPool(HTTPConnectionPool):
+        ConnectionCls = TimedConnection
+
+    adapter.poolmanager.pool_classes_by_scheme = dict(adapter.poolmanager.pool_classes_by_scheme, http=TimedPool)
+    return adapter
@@ -23,7 +23,11 @@ setup(
         'Programming Language :: Python :: 3.5',
     ],
     keywords='RV6688BCM router-control gpon rvcm',
-    install_requires=['click>=6.4', 'requests>=2.10', 'lxml>=3.6'],
+    install_requires=['click>=7.0', 'requests>=2.10', 'lxml>=3.6'],
+    extras_require={
+        'async': ['aiohttp>=3.0'],
+        'msgpack': ['msgpack>=1.0'],
+    },
     entry_points={
         'console_scripts': [
             'rvcm=rvcm.__main__:main'
@@ -0,0 +1,55 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from rvcm.cache import ResponseCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(ttl=60, directory=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_invalidate_keeps_pages_being_written(self):
+        self.cache.put('192.168.100.1', '/vs.htm', 'page')
+        path = self.cache._path('192.168.100.1', '/vs.htm')
+        writing = path + '.1.2.tmp'
+        with open(writing, 'w') as f:
+            f.write('{}')
+        self.cache.invalidate('192.168.100.1')
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(writing))
+        self.assertIsNone(ResponseCache(ttl=60, directory=self.tmp.name).get('192.168.100.1', '/vs.htm'))
+
+    def test_put_survives_removed_file(self):
+        with mock.patch('os.replace', side_effect=FileNotFoundError):
+            self.cache.put('192.168.100.1', '/vs.htm', 'page')
+        self.assertEqual(self.cache.get('192.168.100.1', '/vs.htm'), 'page')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import unittest
+
+from rvcm.cli import Context
+
+
+class Response:
+    status_code = 200
+    content = b'page'
+    text = 'page'
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Session:
+    def request(self, method, url, **kwargs):
+        return Response()
+
+    def close(self):
+        pass
+
+
+class SlotsTest(unittest.TestCase):
+    def context(self, ip):
+        ctx = Context(ip, 'admin', 'admin', concurrency=1)
+        ctx._session = Session()
+        return ctx
+
+    def test_streamed_response_holds_slot_until_closed(self):
+        ctx = self.context('10.1.0.1')
+        resp = ctx.getter('/voice_call_logs.htm', stream=True)
+        self.assertFalse(ctx.slots.acquire(blocking=False))
+        resp.close()
+        self.assertTrue(resp.closed)
+        self.assertTrue(ctx.slots.acquire(blocking=False))
+        ctx.slots.release()
+        # repeated close does not release twice
+        resp.close()
+        self.assertTrue(ctx.slots.acquire(blocking=False))
+        self.assertFalse(ctx.slots.acquire(blocking=False))
+        ctx.slots.release()
+
+    def test_read_response_releases_slot(self):
+        ctx = self.context('10.1.0.2')
+        ctx.getter('/index.htm')
+        self.assertTrue(ctx.slots.acquire(blocking=False))
+        ctx.slots.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
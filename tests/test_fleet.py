@@ -0,0 +1,53 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import os
+import tempfile
+import unittest
+
+import click
+
+from rvcm.fleet import load_inventory
+
+
+class InventoryTest(unittest.TestCase):
+    def load(self, text, suffix='.txt'):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        try:
+            return load_inventory(path)
+        finally:
+            os.remove(path)
+
+    def test_load(self):
+        targets = self.load('# IP USER PASSWORD TAGS\n192.168.100.1 admin secret office,gpon\n192.168.101.1\n')
+        self.assertEqual([(t.ip, t.password, t.tags) for t in targets],
+                         [('192.168.100.1', 'secret', ['office', 'gpon']), ('192.168.101.1', 'admin', [])])
+
+    def test_duplicated_router(self):
+        with self.assertRaises(click.ClickException):
+            self.load('192.168.100.1\n192.168.100.1 admin other\n')
+        with self.assertRaises(click.ClickException):
+            self.load('[{"ip": "192.168.100.1"}, {"ip": "192.168.100.1"}]', '.json')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import unittest
+
+from rvcm.formats import write_records
+
+
+class Stream(io.StringIO):
+    """
+    Stream which remembers text visible to reader (written before last flush)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.flushed = ''
+
+    def flush(self):
+        super().flush()
+        self.flushed = self.getvalue()
+
+
+class StreamingTest(unittest.TestCase):
+    def check(self, fmt):
+        out = Stream()
+
+        def records():
+            for num in range(3):
+                yield {'num': num}
+                # the record is readable before the next one is produced
+                self.assertIn(str(num), out.flushed)
+
+        self.assertEqual(write_records(records(), fmt, out), 3)
+
+    def test_json(self):
+        self.check('json')
+
+    def test_ndjson(self):
+        self.check('ndjson')
+
+    def test_csv(self):
+        self.check('csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import unittest
+from types import SimpleNamespace
+
+from rvcm.cli import Context
+from rvcm.cache import ResponseCache, CachedResponse
+from rvcm.nat import NAT, NATConflict, RuleIndex, Forward, ForwardType
+
+
+def page(vs_list: str) -> str:
+    return 'var vs_list = "' + vs_list + '";\n'
+
+
+class EditsTest(unittest.TestCase):
+    def setUp(self):
+        self.nat = NAT()
+        self.nat.parse(page('1-web-80-80-1-80-80-10-0-;0-ssh-2222-2222-1-22-22-11-0-;'))
+
+    def test_update_logs_rule_name(self):
+        self.nat.update('web', dest_ip_sec=12)
+        self.assertEqual(self.nat.edits[-1], {'op': 'update', 'name': 'web', 'dest_ip_sec': 12})
+
+    def test_rename_logs_rule_name(self):
+        self.nat.rename('ssh', 'shell')
+        self.assertEqual(self.nat.edits[-1], {'op': 'rename', 'name': 'ssh', 'new_name': 'shell'})
+
+    def test_enable_logs_rule_name(self):
+        self.nat.enable('ssh')
+        self.assertEqual(self.nat.edits[-1], {'op': 'enable', 'name': 'ssh'})
+
+    def test_update_is_replayed_on_changed_table(self):
+        self.nat.update('web', dest_ip_sec=12)
+        live = SimpleNamespace(text=page('1-web-80-80-1-80-80-10-0-;1-ftp-21-21-1-21-21-13-0-;'), url=NAT.URL)
+        self.assertTrue(self.nat.rebase(live))
+        self.assertEqual(self.nat.vs_list(), '1-web-80-80-1-80-80-12-0-;1-ftp-21-21-1-21-21-13-0-;')
+
+
+class RuleIndexTest(unittest.TestCase):
+    def rule(self, name, low, high, type=ForwardType.BOTH):
+        return Forward(name=name, dest_ip_sec=5, src_min_port=low, src_max_port=high, dest_min_port=low,
+                       dest_max_port=high, enabled=True, type=type)
+
+    def test_conflicts(self):
+        wide, inner, tcp, far = (self.rule('wide', 100, 200), self.rule('inner', 150, 160),
+                                 self.rule('tcp', 195, 210, ForwardType.TCP), self.rule('far', 1000, 1000))
+        index = RuleIndex([wide, inner, tcp, far])
+        self.assertEqual(index.conflicts(self.rule('new', 180, 190)), [wide])
+        self.assertEqual(index.conflicts(self.rule('new', 205, 205, ForwardType.TCP)), [tcp])
+        self.assertEqual(index.conflicts(self.rule('new', 205, 205, ForwardType.UDP)), [])
+        self.assertEqual(index.conflicts(inner), [wide])
+        self.assertEqual(index.conflicts(self.rule('new', 500, 999)), [])
+
+
+class FakeRouter:
+    """
+    Router which keeps forwarding table and answers save by NAT page with the stored table
+    """
+
+    def __init__(self, vs_list: str):
+        self.vs_list = vs_list
+        self.posts = []
+
+    def getter(self, url, fresh=False):
+        return SimpleNamespace(text=page(self.vs_list), url=url)
+
+    def poster(self, url, data, referer=""):
+        self.posts.append(data)
+        self.vs_list = data['h_vs_list']
+        return self.getter(NAT.URL)
+
+
+class TransactionTest(unittest.TestCase):
+    def test_table_matches_router_after_save(self):
+        router = FakeRouter('1-web-80-80-1-80-80-10-0-;')
+        with NAT.transaction(router.getter, router.poster) as nat:
+            nat.disable('web')
+        self.assertEqual(len(router.posts), 1)
+        self.assertEqual(nat.vs_list(), router.vs_list)
+        self.assertEqual(nat.version, NAT().retrieve(router.getter).version)
+        self.assertEqual(nat.edits, [])
+        self.assertFalse(nat.forwards[0].enabled)
+
+
+class OverwritingRouter(FakeRouter):
+    """
+    Router where another writer saves its table, read before this save, right after the first `overwrites` saves
+    """
+
+    def __init__(self, vs_list: str, other: str, overwrites: int):
+        super().__init__(vs_list)
+        self.other = other
+        self.overwrites = overwrites
+
+    def poster(self, url, data, referer=""):
+        resp = super().poster(url, data, referer)
+        if len(self.posts) <= self.overwrites:
+            self.vs_list = self.other
+        return resp
+
+
+class ConcurrentWriterTest(unittest.TestCase):
+    TABLE = '1-web-80-80-1-80-80-10-0-;'
+    # table of another writer which read TABLE before this save and added its rule
+    OTHER = '1-web-80-80-1-80-80-10-0-;1-ftp-21-21-1-21-21-13-0-;'
+
+    def create(self, nat):
+        nat.create(Forward(name='ssh', dest_ip_sec=11, src_min_port=2222, src_max_port=2222, dest_min_port=22,
+                           dest_max_port=22, enabled=True, type=ForwardType.BOTH))
+
+    def test_overwritten_edits_are_saved_again(self):
+        router = OverwritingRouter(self.TABLE, self.OTHER, overwrites=1)
+        with NAT.transaction(router.getter, router.poster, guard=True) as nat:
+            self.create(nat)
+        self.assertEqual(len(router.posts), 2)
+        self.assertEqual(router.vs_list, self.OTHER + '1-ssh-2222-2222-3-22-22-11-0-;')
+        self.assertEqual(nat.vs_list(), router.vs_list)
+
+    def test_kept_edits_are_not_saved_again(self):
+        router = FakeRouter(self.TABLE)
+        with NAT.transaction(router.getter, router.poster, guard=True) as nat:
+            self.create(nat)
+        self.assertEqual(len(router.posts), 1)
+        self.assertEqual(router.vs_list.count('ssh'), 1)
+
+    def test_overwritten_edits_are_saved_again_async(self):
+        import asyncio
+        router = OverwritingRouter(self.TABLE, self.OTHER, overwrites=1)
+
+        async def getter(url, fresh=False):
+            return router.getter(url, fresh)
+
+        async def poster(url, data, referer=""):
+            return router.poster(url, data, referer)
+
+        async def run():
+            nat = await NAT().retrieve_async(getter)
+            self.create(nat)
+            return await nat.save_async(poster, getter)
+
+        loop = asyncio.new_event_loop()
+        try:
+            nat = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(len(router.posts), 2)
+        self.assertEqual(nat.vs_list(), self.OTHER + '1-ssh-2222-2222-3-22-22-11-0-;')
+
+    def test_conflict_when_always_overwritten(self):
+        router = OverwritingRouter(self.TABLE, self.OTHER, overwrites=NAT.SAVE_ATTEMPTS)
+        with self.assertRaises(NATConflict):
+            with NAT.transaction(router.getter, router.poster, guard=True) as nat:
+                self.create(nat)
+        self.assertEqual(len(router.posts), NAT.SAVE_ATTEMPTS)
+        self.assertEqual(router.vs_list, self.OTHER)
+
+
+class CachedSaveTest(unittest.TestCase):
+    def setUp(self):
+        self.router = page('1-web-80-80-1-80-80-10-0-;0-ssh-2222-2222-1-22-22-11-0-;')
+        self.posts = []
+        self.ctx = Context('127.0.0.1:8680', 'admin', 'admin', cache=ResponseCache(ttl=60))
+        self.reads = 0
+        self.ctx._get = self.get
+
+    def get(self, url, stream):
+        self.reads += 1
+        return CachedResponse(url, self.router)
+
+    def poster(self, url, data, referer=""):
+        self.posts.append(data)
+
+    def test_save_costs_one_read(self):
+        with NAT.transaction(self.ctx.getter, self.poster) as nat:
+            nat.rename('web', 'www')
+        self.assertEqual((self.reads, len(self.posts)), (1, 1))
+
+    def test_guarded_save_checks_live_table_past_cache(self):
+        with NAT.transaction(self.ctx.getter, self.poster, guard=True) as nat:
+            # another client removes rule while this one edits cached table
+            self.router = page('1-web-80-80-1-80-80-10-0-;')
+            nat.rename('web', 'www')
+        self.assertEqual(len(self.posts), 1)
+        self.assertEqual(nat.vs_list(), '1-www-80-80-1-80-80-10-0-;')
+        self.assertEqual(self.ctx.getter(NAT.URL).text, self.router)
+
+
+if __name__ == '__main__':
+    unittest.main()
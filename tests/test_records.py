@@ -0,0 +1,78 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import unittest
+from datetime import datetime
+
+from rvcm.formats import write_records, read_records
+from rvcm.nat import Forward, ForwardType
+from rvcm.calls import Call, Abonent
+from rvcm.router import Info
+
+
+def round_trip(records, fmt, cls):
+    out = io.StringIO()
+    write_records(records, fmt, out)
+    return list(read_records(io.StringIO(out.getvalue()), fmt, cls))
+
+
+class RoundTripTest(unittest.TestCase):
+    forward = Forward(name='x', dest_ip_sec=5, src_min_port=80, src_max_port=80, dest_min_port=8080,
+                      dest_max_port=8080, enabled=False, type=ForwardType.TCP)
+    call = Call(line=2, direction='IN', calling=Abonent('74950000001', '10.0.0.2'), called=Abonent('101', ''),
+                duration_seconds=61, stamp=datetime(2016, 11, 28, 12, 30, 5), status='Answered')
+    info = Info(ip='10.0.0.1', phone_line_up=True, wan_line_up=False, lan_line_up=True, apply_required=False)
+
+    def check(self, record, cls):
+        for fmt in ('json', 'ndjson', 'csv'):
+            restored, = round_trip([record], fmt, cls)
+            self.assertEqual(restored.to_dict(), record.to_dict(), fmt)
+            self.assertEqual(restored.to_tuple(), record.to_tuple(), fmt)
+
+    def test_forward(self):
+        self.check(self.forward, Forward)
+        restored, = round_trip([self.forward], 'csv', Forward)
+        self.assertIs(restored.enabled, False)
+        self.assertEqual(str(restored), str(self.forward))
+
+    def test_call(self):
+        self.check(self.call, Call)
+        restored, = round_trip([self.call], 'csv', Call)
+        self.assertEqual((restored.line, restored.duration), (2, 61))
+
+    def test_info(self):
+        self.check(self.info, Info)
+
+    def test_invalid_boolean(self):
+        with self.assertRaises(ValueError):
+            Forward.from_dict({'enabled': 'maybe'})
+
+    def test_stamp(self):
+        for stamp in ('2016-11-28T12:30:05', '2016-11-28T12:30:05.250000'):
+            call = Call.from_dict({'stamp': stamp})
+            self.assertEqual(call.to_dict()['stamp'], stamp)
+
+    def test_keys_order(self):
+        self.assertEqual(tuple(self.call.to_dict()), Call.keys())
+
+
+if __name__ == '__main__':
+    unittest.main()
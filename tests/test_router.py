@@ -0,0 +1,48 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import unittest
+from unittest import mock
+
+from rvcm.router import Info, Watcher
+
+
+class WatcherTest(unittest.TestCase):
+    def poll(self, watcher, result):
+        retrieve = mock.Mock(side_effect=result) if isinstance(result, Exception) else mock.Mock(return_value=result)
+        with mock.patch.object(Info, 'retrieve', retrieve):
+            return [event['event'] for event in watcher.poll()]
+
+    def test_recovered_before_change(self):
+        watcher = Watcher(None)
+        self.assertEqual(self.poll(watcher, Info(ip='10.0.0.1')), ['snapshot'])
+        self.assertEqual(self.poll(watcher, OSError('down')), ['error'])
+        self.assertEqual(self.poll(watcher, OSError('down')), [])
+        self.assertEqual(self.poll(watcher, Info(ip='10.0.0.2')), ['recovered', 'change'])
+        self.assertEqual(self.poll(watcher, Info(ip='10.0.0.2')), [])
+
+    def test_recovered_before_snapshot(self):
+        watcher = Watcher(None)
+        self.assertEqual(self.poll(watcher, OSError('down')), ['error'])
+        self.assertEqual(self.poll(watcher, Info()), ['recovered', 'snapshot'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+This is library and CLI utils for controlling RV6688BCM router
+It is required python 3.5 or higher and requests library (due to Digest HTTP auth)
+
+The MIT License (MIT)
+Copyright (c) 2016 Baryshnikov Alexander <dev@baryshnikov.net>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions
+of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import unittest
+from types import SimpleNamespace
+
+from rvcm.cache import CachedResponse
+from rvcm.serve import Handler, Agent, sync_nat
+
+
+def route(path, agents):
+    server = SimpleNamespace(agents=agents, routes=sorted(agents, key=len, reverse=True))
+    return Handler._route(SimpleNamespace(path=path, server=server))
+
+
+class RouteTest(unittest.TestCase):
+    agents = dict.fromkeys(['192.168.100.1', '127.0.0.1:8680/r0001', '127.0.0.1:8680/r0001x'])
+
+    def test_plain_ip(self):
+        self.assertEqual(route('/routers/192.168.100.1/nat/batch', self.agents), ('192.168.100.1', ['nat', 'batch']))
+
+    def test_ip_with_slash(self):
+        self.assertEqual(route('/routers/127.0.0.1:8680/r0001/info?x=1', self.agents),
+                         ('127.0.0.1:8680/r0001', ['info']))
+        self.assertEqual(route('/routers/127.0.0.1:8680/r0001x/nat', self.agents), ('127.0.0.1:8680/r0001x', ['nat']))
+
+    def test_unknown(self):
+        self.assertEqual(route('/routers/127.0.0.1:8680/r0002/info', self.agents), (None, []))
+        self.assertEqual(route('/other/192.168.100.1/info', self.agents), (None, []))
+
+
+class Router:
+    """
+    Context of router with NAT page which download can be held
+    """
+
+    def __init__(self, vs_list):
+        self.ip = '192.168.100.1'
+        self.page = 'var vs_list = "' + vs_list + '";\n'
+        self.hold = threading.Event()
+        self.hold.set()
+        self.started = threading.Event()
+
+    def getter(self, url, stream=False, fresh=False):
+        page = self.page
+        self.started.set()
+        self.hold.wait()
+        return CachedResponse(url, page)
+
+    def close(self):
+        pass
+
+
+class AgentTest(unittest.TestCase):
+    def test_read_started_before_write_is_not_cached(self):
+        router = Router('1-web-80-80-1-80-80-10-0-;')
+        agent = Agent(router, refresh=60)
+        stored = [{'name': 'www'}]
+        try:
+            router.hold.clear()
+            reader = threading.Thread(target=agent.read, args=('nat',))
+            reader.start()
+            router.started.wait()
+            agent.write(lambda context: {'changed': True, 'nat': stored})
+            router.hold.set()
+            reader.join()
+            self.assertEqual(agent.read('nat')[0], stored)
+        finally:
+            agent.close()
+
+    def test_sync_rejects_non_list(self):
+        for payload in ({'name': 'web'}, 'web', None, [1]):
+            with self.assertRaises(ValueError):
+                sync_nat(payload)
+
+
+if __name__ == '__main__':
+    unittest.main()